@@ -0,0 +1,171 @@
+"""
+In-memory answer cache for the query engine.
+
+Answers are keyed by (mode, normalised question, index version). The index
+version comes from the manifest written by process_docs.py, so any change to
+the index invalidates every cached answer. An optional semantic tier reuses
+an answer when a new question's embedding is within
+ANSWER_CACHE_SIMILARITY_THRESHOLD (cosine) of a cached question in the same
+mode; it is off by default, because questions that differ only in a substance
+name or CAS number can embed almost identically.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY_THRESHOLD
+from index_manifest import get_manifest_path, get_index_version
+from vector_ops import normalize_rows
+
+def normalize_question(question):
+    """Case- and whitespace-insensitive form of a question"""
+    return " ".join(question.lower().split())
+
+def _unit(vector):
+    return normalize_rows(vector)[0]
+
+class QuestionVectors:
+    """Unit question vectors of one mode, as rows of a matrix scored in one product"""
+
+    def __init__(self):
+        self.keys = []  # row -> cache key
+        self.rows = {}  # cache key -> row
+        self.matrix = None
+
+    def add(self, key, vector):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if self.matrix is None:
+                self.matrix = np.empty((16, len(vector)), dtype=np.float32)
+            elif row == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+            self.keys.append(key)
+            self.rows[key] = row
+        self.matrix[row] = vector
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # Move the last row into the gap
+        last_key = self.keys.pop()
+        if last_key != key:
+            self.matrix[row] = self.matrix[len(self.keys)]
+            self.keys[row] = last_key
+            self.rows[last_key] = row
+
+    def best(self, vector, threshold):
+        """Key of the most similar question scoring at least `threshold`, or None"""
+        if not self.keys:
+            return None
+        scores = self.matrix[:len(self.keys)] @ vector
+        row = int(np.argmax(scores))
+        return self.keys[row] if scores[row] >= threshold else None
+
+class AnswerCache:
+    """Thread-safe LRU cache of query results"""
+
+    def __init__(self, db_path, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # (mode, question) -> result
+        self._vectors = {}  # mode -> QuestionVectors (semantic tier)
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._index_version = None
+
+    @property
+    def semantic(self):
+        return self.similarity_threshold is not None
+
+    def _check_index_version(self):
+        """Drop every entry when process_docs.py has changed the index since they were cached"""
+        # Only re-read the manifest when the file itself has changed
+        try:
+            stat = os.stat(get_manifest_path(self.db_path))
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._manifest_stamp:
+            return
+        self._manifest_stamp = stamp
+        version = get_index_version(self.db_path) if stamp else 0
+        if version != self._index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._vectors.clear()
+            self._index_version = version
+
+    def get(self, question, mode, embed=None):
+        """
+        Look up a question. `embed` (question -> vector) is only called when
+        there is no exact match and the semantic tier is enabled.
+        Returns: (result, kind, vector) where kind is "exact", "semantic" or None;
+        pass `vector` back to put() so the question isn't embedded twice.
+        """
+        key = (mode, normalize_question(question))
+        with self._lock:
+            self._check_index_version()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key], "exact", None
+            if not (self.semantic and embed is not None and self._entries):
+                self.misses += 1
+                return None, None, None
+
+        vector = _unit(embed(question))
+        with self._lock:
+            vectors = self._vectors.get(mode)
+            best_key = vectors.best(vector, self.similarity_threshold) if vectors is not None else None
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._entries[best_key], "semantic", vector
+            self.misses += 1
+            return None, None, vector
+
+    def put(self, question, mode, result, vector=None, embed=None):
+        """Cache a result; the question is embedded (if not given) only for the semantic tier"""
+        key = (mode, normalize_question(question))
+        if self.semantic and vector is None and embed is not None:
+            vector = _unit(embed(question))
+        with self._lock:
+            self._check_index_version()
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if self.semantic and vector is not None:
+                self._vectors.setdefault(mode, QuestionVectors()).add(key, vector)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                if evicted[0] in self._vectors:
+                    self._vectors[evicted[0]].remove(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current cache size"""
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+                "index_version": self._index_version,
+            }
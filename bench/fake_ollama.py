@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Ollama HTTP API, for offline benchmarks.
+
+Embeddings are deterministic hashed bag-of-words vectors (texts sharing words
+get similar vectors, so retrieval still behaves sensibly) and generations are
+deterministic filler text streamed with a configurable per-token latency.
+Like a real Ollama host, at most `parallel` requests (OLLAMA_NUM_PARALLEL) are
+served at once; the rest wait.
+
+Point the project at it with OLLAMA_HOST=http://127.0.0.1:<port>.
+
+Endpoints: /api/embed, /api/embeddings, /api/generate (streaming or not),
+/api/tags, /api/show, /api/version
+
+Run with: python bench/fake_ollama.py --port 11435 --token-latency 0.02
+"""
+
+import argparse
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+FILLER_WORDS = (
+    "the documents describe levels of nicotine and flavouring agents in several products while "
+    "reported results vary between studies depending on the analytical method sample size and region"
+).split()
+
+def embed_text(text, dimensions):
+    """Unit-length hashed bag-of-words vector (identical across runs and processes)"""
+    vector = [0.0] * dimensions
+    for word in _WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode())
+        vector[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        vector[0], norm = 1.0, 1.0
+    return [value / norm for value in vector]
+
+def generate_tokens(prompt, count):
+    """Deterministic filler tokens for a prompt"""
+    start = zlib.crc32(prompt.encode()) % len(FILLER_WORDS)
+    return [FILLER_WORDS[(start + i) % len(FILLER_WORDS)] + " " for i in range(count)]
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dimensions=768, tokens=64, token_latency=0.02, prompt_latency=0.05,
+                 embed_latency=0.005, parallel=4):
+        super().__init__(address, FakeOllamaHandler)
+        self.dimensions = dimensions
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self.embed_latency = embed_latency
+        self.slots = threading.Semaphore(parallel)
+        self.counts_lock = threading.Lock()
+        self.counts = {"embed_requests": 0, "texts_embedded": 0, "generate_requests": 0, "tokens_generated": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, **values):
+        with self.counts_lock:
+            for key, value in values.items():
+                self.counts[key] += value
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": []})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/":
+            self._send_json({"status": "Ollama is running"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/embed":
+            texts = request.get("input", [])
+            if isinstance(texts, str):
+                texts = [texts]
+            self._send_json({"model": request.get("model", ""), "embeddings": self._embed(texts)})
+        elif self.path == "/api/embeddings":
+            self._send_json({"embedding": self._embed([request.get("prompt", "")])[0]})
+        elif self.path == "/api/generate":
+            self._generate(request)
+        elif self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _embed(self, texts):
+        server = self.server
+        with server.slots:
+            time.sleep(server.embed_latency)
+            vectors = [embed_text(text, server.dimensions) for text in texts]
+        server.count(embed_requests=1, texts_embedded=len(texts))
+        return vectors
+
+    def _generate(self, request):
+        server = self.server
+        model = request.get("model", "")
+        prompt = request.get("prompt", "")
+        count = (request.get("options") or {}).get("num_predict") or server.tokens
+        if count < 0:
+            count = server.tokens
+        tokens = generate_tokens(prompt, count)
+        started = time.perf_counter()
+
+        with server.slots:
+            time.sleep(server.prompt_latency)
+            if request.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(server.token_latency)
+                    self._write_chunk({"model": model, "created_at": _timestamp(), "response": token, "done": False})
+            else:
+                time.sleep(server.token_latency * len(tokens))
+
+        final = {
+            "model": model,
+            "created_at": _timestamp(),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "prompt_eval_count": len(prompt) // 4,
+            "eval_count": len(tokens),
+        }
+        server.count(generate_requests=1, tokens_generated=len(tokens))
+        if request.get("stream", True):
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            final["response"] = "".join(tokens)
+            self._send_json(final)
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def start_fake_ollama(host="127.0.0.1", port=0, **settings):
+    """Serve the fake API from a background thread; `port=0` picks a free port"""
+    server = FakeOllamaServer((host, port), **settings)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a deterministic stand-in for the Ollama API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--dimensions', type=int, default=768, help='Embedding size (default: 768, nomic-embed-text)')
+    parser.add_argument('--tokens', type=int, default=64, help='Tokens per generation (default: 64)')
+    parser.add_argument('--token-latency', type=float, default=0.02, help='Seconds per generated token (default: 0.02)')
+    parser.add_argument('--prompt-latency', type=float, default=0.05, help='Seconds before the first token (default: 0.05)')
+    parser.add_argument('--embed-latency', type=float, default=0.005, help='Seconds per embedding request (default: 0.005)')
+    parser.add_argument('--parallel', type=int, default=4, help='Requests served at once, like OLLAMA_NUM_PARALLEL (default: 4)')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        (args.host, args.port), dimensions=args.dimensions, tokens=args.tokens, token_latency=args.token_latency,
+        prompt_latency=args.prompt_latency, embed_latency=args.embed_latency, parallel=args.parallel
+    )
+    print(f"Fake Ollama listening on {server.url} (set OLLAMA_HOST={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
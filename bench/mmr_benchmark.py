@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+MMR microbenchmark: LangChain's MMR (what Chroma's max_marginal_relevance_search
+runs) vs the vectorised vector_ops implementation, at several fetch_k values.
+
+Synthetic mode (default) times the selection step alone on random vectors.
+With --live it times complete retrievals against the real vector store:
+vectorstore.max_marginal_relevance_search vs MMRRetriever.
+
+Run with: python bench/mmr_benchmark.py [--live "a question"]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from vector_ops import maximal_marginal_relevance
+
+try:
+    from langchain_chroma.vectorstores import maximal_marginal_relevance as langchain_mmr
+except ImportError:
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance as langchain_mmr
+
+FETCH_KS = (20, 100, 500)
+
+def time_call(func, repeats):
+    """Median and p95 wall time of `func()` in milliseconds"""
+    func()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+def run_synthetic(k, lambda_mult, dimensions, repeats):
+    rng = np.random.default_rng(0)
+    print(f"Selection step only: k={k}, lambda_mult={lambda_mult}, {dimensions} dimensions, {repeats} runs")
+    print(f"{'fetch_k':>8}  {'langchain ms (p50/p95)':>24}  {'vectorised ms (p50/p95)':>24}  {'speedup':>8}")
+    for fetch_k in FETCH_KS:
+        query = rng.standard_normal(dimensions).astype(np.float32)
+        candidates = rng.standard_normal((fetch_k, dimensions)).astype(np.float32)
+        candidate_list = candidates.tolist()
+
+        # LangChain's version receives Python lists from the Chroma response
+        baseline = time_call(lambda: langchain_mmr(query, candidate_list, lambda_mult=lambda_mult, k=k), repeats)
+        vectorised = time_call(lambda: maximal_marginal_relevance(query, candidates, k, lambda_mult), repeats)
+        print(f"{fetch_k:>8}  {baseline[0]:>11.2f} / {baseline[1]:<10.2f}  "
+              f"{vectorised[0]:>11.2f} / {vectorised[1]:<10.2f}  {baseline[0] / vectorised[0]:>7.1f}x")
+
+def run_live(question, k, lambda_mult, repeats):
+    from config import VECTOR_DB_PATH
+    from embedding_cache import get_embeddings
+    from namespaces import open_vectorstore
+    from vector_ops import MMRRetriever
+
+    embeddings = get_embeddings()
+    vectorstore = open_vectorstore(embeddings)
+    print(f"Full retrieval against {VECTOR_DB_PATH}: k={k}, lambda_mult={lambda_mult}, {repeats} runs")
+    print(f"{'fetch_k':>8}  {'langchain ms (p50/p95)':>24}  {'vectorised ms (p50/p95)':>24}  {'speedup':>8}")
+    for fetch_k in FETCH_KS:
+        retriever = MMRRetriever(vectorstore, embeddings, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        baseline = time_call(lambda: vectorstore.max_marginal_relevance_search(
+            question, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult), repeats)
+        vectorised = time_call(lambda: retriever.invoke(question), repeats)
+        print(f"{fetch_k:>8}  {baseline[0]:>11.2f} / {baseline[1]:<10.2f}  "
+              f"{vectorised[0]:>11.2f} / {vectorised[1]:<10.2f}  {baseline[0] / vectorised[0]:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare LangChain MMR with the vectorised implementation')
+    parser.add_argument('--k', type=int, default=5, help='Chunks selected (default: 5)')
+    parser.add_argument('--lambda-mult', type=float, default=0.7, help='Relevance vs diversity (default: 0.7)')
+    parser.add_argument('--dimensions', type=int, default=768, help='Vector size for synthetic runs (default: 768, nomic-embed-text)')
+    parser.add_argument('--repeats', type=int, default=50, help='Timed runs per configuration (default: 50)')
+    parser.add_argument('--live', metavar='QUESTION', help='Time full retrievals against the real vector store')
+    args = parser.parse_args()
+
+    if args.live:
+        run_live(args.live, args.k, args.lambda_mult, args.repeats)
+    else:
+        run_synthetic(args.k, args.lambda_mult, args.dimensions, args.repeats)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks against a local Ollama stand-in (bench/fake_ollama.py).
+
+Generates a synthetic corpus in a scratch folder, then measures:
+- indexing: process_documents() throughput, plus a no-change re-run
+- query: query latency percentiles per mode (answer cache off)
+- web: /query throughput and latency under concurrent load (a server subprocess)
+- extract: extraction wall time over the corpus
+
+Everything runs offline and deterministically, so results written to JSON can
+be compared run to run (--compare a previous results file).
+
+Run with: python bench/run_benchmarks.py [--documents 200] [--sections query web]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ollama import start_fake_ollama
+from synthetic_corpus import generate_corpus, make_questions
+
+SECTIONS = ("indexing", "query", "web", "extract")
+
+def percentiles(samples_ms):
+    """Latency summary of a list of milliseconds (nearest-rank percentiles)"""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered),
+        "p50_ms": rank(50),
+        "p90_ms": rank(90),
+        "p99_ms": rank(99),
+        "max_ms": ordered[-1],
+    }
+
+def quiet(verbose):
+    """Silence the project's progress output unless --verbose"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_indexing(docs_dir, args):
+    import tracing
+    from config import VECTOR_DB_PATH
+    from process_docs import process_documents
+
+    tracing.reset()
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        vectorstore = process_documents([docs_dir], VECTOR_DB_PATH)
+    seconds = time.perf_counter() - start
+    chunks = vectorstore._collection.count() if vectorstore is not None else 0
+    stages = tracing.snapshot()
+
+    # Nothing changed: only discovery and hashing should run
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        process_documents([docs_dir], VECTOR_DB_PATH)
+    noop_seconds = time.perf_counter() - start
+
+    return {
+        "files": args.documents,
+        "chunks": chunks,
+        "seconds": seconds,
+        "files_per_second": args.documents / seconds,
+        "chunks_per_second": chunks / seconds,
+        "reindex_noop_seconds": noop_seconds,
+        **stages,
+    }
+
+def bench_query(args):
+    import tracing
+    from rag_query import RagEngine
+
+    engine = RagEngine()
+    # Measure the pipeline itself, not answer cache hits
+    engine.answer_cache = None
+    results = {}
+    for offset, mode in enumerate(args.modes):
+        questions = make_questions(args.queries + 1, seed=args.seed + offset)
+        with quiet(args.verbose):
+            engine.query(questions[0], mode=mode)  # warm-up: pipeline, lexical index
+        tracing.reset()
+        samples = []
+        for question in questions[1:]:
+            start = time.perf_counter()
+            with quiet(args.verbose):
+                engine.query(question, mode=mode)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[mode] = {**percentiles(samples), **tracing.snapshot()}
+    return results
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def post_json(url, payload, timeout):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def wait_for_server(url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"web server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=5):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError("web server did not start in time")
+
+def bench_web(ollama_url, args):
+    script = "asgi_rag.py" if args.server == "asgi" else "web_rag.py"
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, PORT=str(port), OLLAMA_HOST=ollama_url)
+    with open("web_server.log", "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(PROJECT_DIR, "other", script)], env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    try:
+        wait_for_server(url, process)
+        # Distinct questions, so the server's answer cache doesn't serve them
+        questions = make_questions(args.web_requests, seed=args.seed + 100)
+        post_json(f"{url}/query", {"question": "warm-up", "mode": "qa"}, timeout=300)
+
+        def timed(question):
+            start = time.perf_counter()
+            status = post_json(f"{url}/query", {"question": question, "mode": "qa"}, timeout=300)
+            return status, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.web_concurrency) as executor:
+            responses = list(executor.map(timed, questions))
+        seconds = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    succeeded = [ms for status, ms in responses if status == 200]
+    return {
+        "server": args.server,
+        "concurrency": args.web_concurrency,
+        "requests": len(responses),
+        "succeeded": len(succeeded),
+        "rejected": sum(1 for status, _ in responses if status == 503),
+        "errors": sum(1 for status, _ in responses if status not in (200, 503)),
+        "seconds": seconds,
+        "requests_per_second": len(succeeded) / seconds,
+        **percentiles(succeeded),
+    }
+
+def bench_extract(args):
+    import tracing
+    from extract_documents import extract_from_all_documents
+
+    tracing.reset()
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        result = extract_from_all_documents(
+            "List all substances and their CAS numbers",
+            verbose=args.verbose,
+            max_docs=args.extract_docs,
+            workers=args.workers,
+        )
+    seconds = time.perf_counter() - start
+    documents = len(result["individual_extractions"])
+    return {
+        "documents": documents,
+        "workers": args.workers,
+        "seconds": seconds,
+        "documents_per_second": documents / seconds if seconds else 0.0,
+        **tracing.snapshot(),
+    }
+
+def flatten(results, prefix=""):
+    """Numeric leaves as {"query.qa.p50_ms": value}, skipping per-stage detail"""
+    values = {}
+    for key, value in results.items():
+        if key in ("settings", "stages", "counters", "fake_ollama"):
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def print_comparison(baseline, current):
+    before, after = flatten(baseline), flatten(current)
+    names = [name for name in after if name in before]
+    if not names:
+        print("Nothing to compare with the baseline.")
+        return
+    width = max(len(name) for name in names)
+    print(f"\n{'Metric':<{width}}  {'Baseline':>12}  {'Current':>12}  {'Change':>8}")
+    print("-" * (width + 40))
+    for name in names:
+        change = (after[name] - before[name]) / before[name] * 100 if before[name] else 0.0
+        print(f"{name:<{width}}  {before[name]:>12.2f}  {after[name]:>12.2f}  {change:>+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Offline end-to-end benchmarks with a fake Ollama server and a synthetic corpus'
+    )
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS),
+                       help='Benchmarks to run (default: all; indexing always runs to build the index)')
+    parser.add_argument('--documents', type=int, default=100, help='Synthetic files (default: 100)')
+    parser.add_argument('--paragraphs', type=int, default=8, help='Paragraphs per file (default: 8)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=20, help='Timed queries per mode (default: 20)')
+    parser.add_argument('--modes', nargs='+', default=['qa', 'summary'], help='Query modes (default: qa summary)')
+    parser.add_argument('--server', choices=['asgi', 'flask'], default='asgi', help='Web server to load (default: asgi)')
+    parser.add_argument('--web-requests', type=int, default=40, help='Requests sent to the web server (default: 40)')
+    parser.add_argument('--web-concurrency', type=int, default=8, help='Concurrent web clients (default: 8)')
+    parser.add_argument('--extract-docs', type=int, default=None, help='Documents to extract from (default: all)')
+    parser.add_argument('--workers', type=int, default=4, help='Extraction MAP workers (default: 4)')
+    parser.add_argument('--token-latency', type=float, default=0.005, help='Fake seconds per token (default: 0.005)')
+    parser.add_argument('--prompt-latency', type=float, default=0.02, help='Fake seconds to first token (default: 0.02)')
+    parser.add_argument('--embed-latency', type=float, default=0.002, help='Fake seconds per embedding request (default: 0.002)')
+    parser.add_argument('--tokens', type=int, default=64, help='Fake tokens per generation (default: 64)')
+    parser.add_argument('--parallel', type=int, default=4, help='Fake OLLAMA_NUM_PARALLEL (default: 4)')
+    parser.add_argument('--workdir', help='Scratch folder for the corpus and index (default: a new temp folder)')
+    parser.add_argument('-o', '--output', help='Results file (default: bench/results/benchmark_<time>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--verbose', action='store_true', help='Show the project\'s own progress output')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or os.path.join(
+        BENCH_DIR, "results", f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    ))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    server = start_fake_ollama(
+        dimensions=768, tokens=args.tokens, token_latency=args.token_latency,
+        prompt_latency=args.prompt_latency, embed_latency=args.embed_latency, parallel=args.parallel
+    )
+    # Read by the ollama client when the project creates its models
+    os.environ["OLLAMA_HOST"] = server.url
+
+    # config.py paths (vector store, caches, checkpoints) are relative, so they land in the scratch folder
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    docs_dir = os.path.join(workdir, "documents")
+    generate_corpus(docs_dir, args.documents, args.paragraphs, args.seed)
+    os.chdir(workdir)
+    print(f"Fake Ollama at {server.url}; corpus of {args.documents} files in {docs_dir}")
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "workdir")},
+    }
+
+    print("Indexing...")
+    results["indexing"] = bench_indexing(docs_dir, args)
+    print(f"  {results['indexing']['chunks']} chunks in {results['indexing']['seconds']:.1f}s "
+          f"({results['indexing']['chunks_per_second']:.0f} chunks/s)")
+
+    if "query" in args.sections:
+        print("Query latency...")
+        results["query"] = bench_query(args)
+        for mode, summary in results["query"].items():
+            print(f"  {mode}: p50 {summary['p50_ms']:.0f} ms, p90 {summary['p90_ms']:.0f} ms, p99 {summary['p99_ms']:.0f} ms")
+
+    if "web" in args.sections:
+        print(f"Web throughput ({args.server}, {args.web_concurrency} clients)...")
+        results["web"] = bench_web(server.url, args)
+        web = results["web"]
+        print(f"  {web['requests_per_second']:.2f} req/s, {web['succeeded']}/{web['requests']} ok"
+              + (f", p50 {web['p50_ms']:.0f} ms, p99 {web['p99_ms']:.0f} ms" if web['succeeded'] else ""))
+
+    if "extract" in args.sections:
+        print("Extraction...")
+        results["extract"] = bench_extract(args)
+        print(f"  {results['extract']['documents']} documents in {results['extract']['seconds']:.1f}s")
+
+    results["fake_ollama"] = dict(server.counts)
+    server.shutdown()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+    if baseline is not None:
+        print_comparison(baseline, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic corpus for benchmarks.
+
+Writes Markdown and plain-text reports built from a fixed vocabulary of
+products, substances (with CAS-style identifiers) and findings, so the same
+seed always produces the same files, and questions that mention terms which
+actually occur in them.
+
+Run with: python bench/synthetic_corpus.py OUTPUT_DIR --documents 200
+"""
+
+import argparse
+import os
+import random
+
+PRODUCTS = ("nicotine pouches", "snus", "moist snuff", "heated tobacco", "e-liquids", "chewing tobacco",
+            "nicotine gum", "lozenges", "dissolvable strips", "oral nicotine sprays")
+SUBSTANCES = ("nicotine", "nornicotine", "anabasine", "anatabine", "n-nitrosonornicotine", "formaldehyde",
+              "acetaldehyde", "menthol", "sucralose", "acesulfame potassium", "propylene glycol", "glycerol",
+              "sodium carbonate", "microcrystalline cellulose", "cadmium", "lead", "arsenic", "chromium")
+FINDINGS = ("were detected in most samples", "remained below the limit of quantification",
+            "varied widely between brands", "increased with storage time", "decreased after extraction",
+            "correlated with the labelled strength", "exceeded the proposed threshold in a few samples",
+            "were comparable to earlier market surveys")
+METHODS = ("LC-MS/MS", "GC-MS", "ICP-MS", "HPLC-UV", "headspace GC", "ion chromatography")
+REGIONS = ("Sweden", "Norway", "Denmark", "Germany", "the United Kingdom", "the United States", "Switzerland")
+FILLER = ("Samples were purchased online and stored at four degrees until analysis.",
+          "Each measurement was performed in triplicate and blanks were analysed with every batch.",
+          "The results are discussed in relation to existing regulation and consumer exposure.",
+          "Limitations include the small number of brands and the absence of long-term data.",
+          "Moisture content and pH were recorded because they affect the release of free base nicotine.",
+          "Quality control samples confirmed the recovery and precision of the method.")
+
+def cas_number(rng):
+    return f"{rng.randint(50, 99999)}-{rng.randint(10, 99)}-{rng.randint(0, 9)}"
+
+def make_document(rng, index, paragraphs):
+    product = rng.choice(PRODUCTS)
+    title = f"Report {index:04d}: {rng.choice(SUBSTANCES)} in {product} sold in {rng.choice(REGIONS)}"
+    lines = [f"# {title}", ""]
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(4, 8)):
+            substance = rng.choice(SUBSTANCES)
+            sentences.append(
+                f"Levels of {substance} (CAS {cas_number(rng)}) in {rng.choice(PRODUCTS)} measured by "
+                f"{rng.choice(METHODS)} {rng.choice(FINDINGS)}."
+            )
+            if rng.random() < 0.5:
+                sentences.append(rng.choice(FILLER))
+        lines.append(" ".join(sentences))
+        lines.append("")
+    return "\n".join(lines)
+
+def generate_corpus(directory, documents=100, paragraphs=8, seed=0):
+    """
+    Write `documents` reports into `directory` (alternating .md and .txt)
+    Returns: list of file paths
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(documents):
+        extension = "md" if index % 2 == 0 else "txt"
+        path = os.path.join(directory, f"report_{index:04d}.{extension}")
+        with open(path, "w") as f:
+            f.write(make_document(rng, index, paragraphs))
+        paths.append(path)
+    return paths
+
+def make_questions(count, seed=0):
+    """`count` distinct questions about terms that occur in the corpus"""
+    rng = random.Random(seed + 1)
+    templates = (
+        "What levels of {substance} were found in {product}?",
+        "Which methods were used to measure {substance} in {product} from {region}?",
+        "Summarize what is reported about {substance} and {other} in {product}.",
+        "How did {substance} content in {product} compare with the threshold in {region}?",
+    )
+    questions = []
+    seen = set()
+    while len(questions) < count:
+        question = rng.choice(templates).format(
+            substance=rng.choice(SUBSTANCES), other=rng.choice(SUBSTANCES),
+            product=rng.choice(PRODUCTS), region=rng.choice(REGIONS)
+        )
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a deterministic synthetic document corpus')
+    parser.add_argument('directory', help='Output folder')
+    parser.add_argument('--documents', type=int, default=100, help='Number of files (default: 100)')
+    parser.add_argument('--paragraphs', type=int, default=8, help='Paragraphs per file (default: 8)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.directory, args.documents, args.paragraphs, args.seed)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"Wrote {len(paths)} files ({size / 1024:.0f} KiB) to {args.directory}")
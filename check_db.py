@@ -1,7 +1,7 @@
 import chromadb
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
-from config import VECTOR_DB_PATH, EMBEDDING_MODEL
+from config import VECTOR_DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL
 
 def view_vector_store_contents():
     try:
@@ -9,8 +9,8 @@ def view_vector_store_contents():
         embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
         
         # Connect to the existing ChromaDB using Langchain
-        # Don't specify collection_name to use the default "langchain" collection
         vectorstore = Chroma(
+            collection_name=COLLECTION_NAME,
             persist_directory=VECTOR_DB_PATH,
             embedding_function=embeddings
         )
@@ -19,7 +19,7 @@ def view_vector_store_contents():
         collection = vectorstore._collection
         count = collection.count()
         
-        print(f"Connected to default Langchain collection with {count} items.")
+        print(f"Connected to collection '{COLLECTION_NAME}' with {count} items.")
         
         # Get some documents from the collection
         if count > 0:
@@ -33,12 +33,34 @@ EXCLUDE_PATTERNS = [
 # Processing settings - optimized for semantic chunking
 CHUNK_SIZE = 512  # Reduced for more precise retrieval and better semantic coherence
 CHUNK_OVERLAP = 128  # 25% overlap to preserve context at chunk boundaries
+CHARS_PER_TOKEN = 4  # Rough characters-per-token ratio used for context budgets
 EMBEDDING_MODEL = "nomic-embed-text"
 LLM_MODEL = "llama3.1:8b"
 
 # Database settings
 VECTOR_DB_PATH = "./chroma_db"
-COLLECTION_NAME = "documents"
+COLLECTION_NAME = "documents"  # Default collection (rag_query.py --collection picks another)
+
+# Named collections, each indexed from its own folders and searched on its own
+COLLECTIONS = {
+    COLLECTION_NAME: DOCUMENT_PATHS,
+}
+
+# Indexing pipeline - embedding is overlapped with loading and database writes
+LOAD_JOBS = max(1, (os.cpu_count() or 2) // 2)  # Worker processes parsing documents (PDF parsing is CPU-heavy)
+EMBED_BATCH_SIZE = 64  # Chunks per embedding request
+EMBED_CONCURRENCY = 4  # Concurrent embedding requests to Ollama
+WRITE_BATCH_SIZE = 1000  # Chunks per ChromaDB upsert
+
+# Embedding cache - reuse vectors for identical texts across runs (indexing, queries, extraction)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite"
+EMBEDDING_CACHE_MAX_ENTRIES = 500000  # Least recently used entries are evicted beyond this
+
+# Answer cache - reuse answers to repeated questions until process_docs.py changes the index
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_ENTRIES = 256  # Least recently used answers are evicted beyond this
+ANSWER_CACHE_SIMILARITY_THRESHOLD = None  # Cosine similarity for reusing a near-duplicate question's answer, e.g. 0.97 (None = exact matches only; questions differing only in a substance name or CAS number can score above 0.95)
 
 # ============================================================================
 # TRIPLE MODE CONFIGURATION
@@ -49,10 +71,14 @@ DEFAULT_MODE = "qa"  # Change default mode here
 
 # QA Mode - For precise question answering
 QA_MODE = {
-    "RETRIEVAL_K": 5,  # Top-5 most relevant chunks
-    "RETRIEVAL_SEARCH_TYPE": "mmr",  # Maximum Marginal Relevance
-    "RETRIEVAL_FETCH_K": 20,  # Fetch more candidates for reranking
-    "RETRIEVAL_LAMBDA_MULT": 0.7,  # Balance relevance vs diversity
+    "RETRIEVAL_K": 4,  # Top-4 chunks (hybrid ranking finds exact names, so fewer are needed)
+    "RETRIEVAL_SEARCH_TYPE": "hybrid",  # BM25 + vector similarity, fused ("similarity", "mmr" or "hybrid")
+    "RETRIEVAL_FETCH_K": 20,  # Candidates taken from each ranking before fusion/reranking
+    "RETRIEVAL_LAMBDA_MULT": 0.7,  # Balance relevance vs diversity (mmr only)
+    "RERANK": False,  # Rerank RETRIEVAL_FETCH_K candidates with a cross-encoder (needs sentence-transformers)
+    "RERANK_TOP_N": 4,  # Chunks kept after reranking
+    "MAX_CONTEXT_TOKENS": None,  # Context budget per prompt (None = MAX_CONTEXT_LENGTH characters)
+    "GENERATION_STRATEGY": "stuff",  # All context in one prompt
     "TEMPERATURE": 0.1,  # Low temperature for factual responses
     "PROMPT_TEMPLATE": """Use the following pieces of context to answer the question at the end. 
     If you don't know the answer, just say that you don't know, don't try to make up an answer.
@@ -72,6 +98,12 @@ SUMMARY_MODE = {
     "RETRIEVAL_SEARCH_TYPE": "similarity",  # Pure similarity (no diversity penalty)
     "RETRIEVAL_FETCH_K": 100,  # Not used in similarity mode
     "RETRIEVAL_LAMBDA_MULT": 1.0,  # Full relevance weight
+    "RERANK": False,  # Rerank RETRIEVAL_FETCH_K candidates with a cross-encoder (needs sentence-transformers)
+    "RERANK_TOP_N": 50,  # Chunks kept after reranking
+    "MAX_CONTEXT_TOKENS": 12000,  # Total context budget; the best chunks that fit are kept
+    "GENERATION_STRATEGY": "map_reduce",  # "stuff" (one prompt) or "map_reduce" (summarise groups concurrently, then combine)
+    "MAP_GROUP_TOKENS": 1500,  # Context per group summary (map_reduce)
+    "MAP_CONCURRENCY": 4,  # Group summaries generated at once (match OLLAMA_NUM_PARALLEL)
     "TEMPERATURE": 0.3,  # Slightly higher for more creative summarization
     "PROMPT_TEMPLATE": """Based on the following document excerpts, provide a comprehensive answer or summary.
     Consider all the context provided and synthesize the information into a coherent response.
@@ -82,13 +114,36 @@ SUMMARY_MODE = {
     
     Question: {question}
     
-    Answer:"""
+    Answer:""",
+    # map_reduce: summarises one group of excerpts; the summaries then fill {context} above
+    "MAP_PROMPT_TEMPLATE": """Summarize what the following document excerpts say that is relevant to the question.
+    Keep key facts, figures, names and sources. If nothing is relevant, reply "Nothing relevant".
+    
+    Excerpts:
+    {context}
+    
+    Question: {question}
+    
+    Relevant summary:"""
 }
 
 # Extract Mode - For systematic extraction across all documents
 EXTRACT_MODE = {
     "TEMPERATURE": 0.0,  # Zero temperature for consistent extraction
-    "BATCH_SIZE": 10,  # Number of documents to process per batch
+    "BATCH_SIZE": 10,  # Max extractions combined per REDUCE call (tree reduce)
+    "REDUCE_MAX_CHARS": 8000,  # Max characters of extractions per REDUCE call
+    "MAP_STRATEGY": "windows",  # "windows" (whole document in context-sized windows), "relevant" (only the chunks most similar to the query) or "first_chunks" (legacy: first 15 chunks)
+    "MAP_WINDOW_TOKENS": 1500,  # Token budget of document text per MAP call ("windows": ~1 call per 1500 tokens of each document, plus a merge)
+    "MAP_RELEVANT_TOKENS": 1500,  # "relevant": token budget of the best chunks kept per document (<= MAP_WINDOW_TOKENS => one MAP call)
+    "WORKERS": 1,  # Concurrent MAP calls (set to the Ollama host's OLLAMA_NUM_PARALLEL)
+    "CHECKPOINT_DIR": "./extract_checkpoints",  # Per-query JSONL files of completed MAP results (--resume)
+    "SCAN_PAGE_SIZE": 5000,  # Chunk metadata rows read per request when listing sources
+    "SOURCE_FETCH_BATCH": 20,  # Sources whose chunks are fetched per request during MAP
+    # Pre-filter: score each source by its chunks' similarity to the extraction query (stored
+    # embeddings, no LLM calls) and only MAP the relevant ones. Off while both limits are None.
+    "PREFILTER_TOP_N": None,  # MAP at most this many of the best-scoring sources
+    "PREFILTER_MIN_SCORE": None,  # MAP only sources scoring at least this (cosine similarity, e.g. 0.5)
+    "PREFILTER_BEST_CHUNKS": 3,  # A source's score is the mean similarity of its best chunks
     "MAP_PROMPT_TEMPLATE": """Extract the following information from this document excerpt:
 
 {extraction_query}
@@ -141,8 +196,19 @@ else:
     TEMPERATURE = EXTRACT_MODE["TEMPERATURE"]
 
 # Advanced retrieval settings
-SIMILARITY_SCORE_THRESHOLD = 0.5  # Minimum similarity score for retrieved chunks
-MAX_CONTEXT_LENGTH = 8000  # Maximum characters to send to LLM as context
+SIMILARITY_SCORE_THRESHOLD = 0.5  # Minimum cosine similarity (question vs chunk) for a chunk to be used as context (not applied to keyword matches or reranked chunks)
+MAX_CONTEXT_LENGTH = 8000  # Maximum characters to send to LLM as context (modes can set MAX_CONTEXT_TOKENS instead)
+
+# Hybrid search - BM25 over a local inverted index, fused with vector results
+BM25_K1 = 1.5  # Term frequency saturation
+BM25_B = 0.75  # Document length normalization
+BM25_MAX_TERM_SHARE = 0.5  # Query terms found in more than this share of chunks are skipped (near-zero idf, slowest to score)
+HYBRID_RRF_K = 60  # Reciprocal-rank fusion constant (higher = flatter weighting of top ranks)
+
+# Reranking - optional cross-encoder stage, enabled per mode with "RERANK"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # Small enough to run on the CPU
+RERANK_BATCH_SIZE = 16  # (question, chunk) pairs scored per forward pass
+RERANK_CACHE_SIZE = 10000  # Cached (question, chunk ID) scores; least recently used are evicted
 
 # Optional: Filter by file modification time (days)
 # Only process files modified in the last N days (0 = all files)
@@ -168,3 +234,10 @@ def get_valid_paths():
 
 # Display settings
 SHOW_SOURCES = True  # Set to False to hide source documents by default
+
+# Async web server (other/asgi_rag.py)
+SERVER_MAX_CONCURRENT_QUERIES = 2  # Queries running against Ollama at once (match OLLAMA_NUM_PARALLEL)
+SERVER_MAX_QUEUED_QUERIES = 16  # Queries allowed to wait; beyond this the server answers 503
+
+# Batch questions (rag_query.py --batch)
+BATCH_QUERY_CONCURRENCY = 2  # Answers generated at once (match OLLAMA_NUM_PARALLEL)
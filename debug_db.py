@@ -12,6 +12,7 @@ def debug_chroma():
     # Try to access via Langchain Chroma
     embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
     vectorstore = Chroma(
+        collection_name=COLLECTION_NAME,
         persist_directory=VECTOR_DB_PATH,
         embedding_function=embeddings
     )
@@ -0,0 +1,144 @@
+"""
+Persistent embedding cache.
+
+Wraps an embeddings client so identical texts are only embedded once across
+runs. Vectors are stored in SQLite keyed by a hash of model name + text, with
+least-recently-used eviction once EMBEDDING_CACHE_MAX_ENTRIES is exceeded.
+Entries for any other model are dropped when the cache is opened, so changing
+EMBEDDING_MODEL in config.py invalidates the cache automatically.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+def _encode(vector):
+    return array("f", vector).tobytes()
+
+def _decode(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper backed by an on-disk SQLite cache"""
+
+    def __init__(self, embeddings, model_name, cache_path=EMBEDDING_CACHE_PATH,
+                 max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            # A different embedding model makes every stored vector stale
+            self._conn.execute("DELETE FROM embeddings WHERE model != ?", (model_name,))
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, keys):
+        """Return {key: vector} for cached keys and mark them as recently used"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock, self._conn:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, _decode(blob)) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def _store(self, items):
+        """Insert {key: vector} and evict least-recently-used entries beyond the size limit"""
+        now = time.time()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, self.model_name, _encode(vector), now) for key, vector in items.items()]
+            )
+            self._size += self._conn.total_changes - before
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        miss_count = sum(1 for key in keys if key not in cached)
+        with self._lock:
+            self.hits += len(keys) - miss_count
+            self.misses += miss_count
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current cache size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self._size,
+            }
+
+def get_embeddings(model=EMBEDDING_MODEL):
+    """Embeddings client used by the indexer, the query engine and extraction"""
+    embeddings = OllamaEmbeddings(model=model)
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, model)
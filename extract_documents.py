@@ -3,45 +3,200 @@ Extract structured information from all documents using map-reduce pattern.
 This systematically processes each document to extract specific information.
 """
 
+import hashlib
 import json
+import os
+import fnmatch
 import time
-from collections import defaultdict
-from langchain_ollama import OllamaEmbeddings, OllamaLLM
-from langchain_chroma import Chroma
+import warnings
+import numpy as np
+from collections import defaultdict, deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
 from config import (
-    EMBEDDING_MODEL, VECTOR_DB_PATH, LLM_MODEL, 
+    VECTOR_DB_PATH, COLLECTION_NAME, LLM_MODEL, 
     EXTRACT_MODE, get_mode_config
 )
+from embedding_cache import get_embeddings
+from index_manifest import load_manifest
+from metadata_filter import build_where, needs_manifest
+from namespaces import get_collection_dir, open_vectorstore
+from vector_ops import cosine_similarities, score_sources
+from text_packing import document_order_key, estimate_tokens, merge_overlapping_chunks, pack_windows
+from tracing import trace, format_profile
 
-def get_all_documents_by_source(vectorstore):
+def group_chunks_by_source(data):
     """
-    Group all chunks by their source document
-    Returns: dict {source_path: [chunks]}
+    Group a collection.get() result by source, each in document order
+    Returns: dict {source_path: [Document]}
     """
-    collection = vectorstore._collection
-    all_data = collection.get(include=["metadatas", "documents"])
-    
     docs_by_source = defaultdict(list)
     
-    for i, metadata in enumerate(all_data["metadatas"]):
+    for i, metadata in enumerate(data["metadatas"]):
+        metadata = metadata or {}
         source = metadata.get("source", "Unknown")
-        content = all_data["documents"][i]
-        docs_by_source[source].append(content)
+        content = data["documents"][i]
+        docs_by_source[source].append((i, Document(page_content=content, metadata=metadata, id=data["ids"][i])))
+    
+    return {
+        source: [doc for position, doc in sorted(chunks, key=lambda c: document_order_key(c[0], c[1].metadata))]
+        for source, chunks in docs_by_source.items()
+    }
+
+def list_sources(collection, path_prefix=None, source_glob=None, max_docs=None, page_size=None, where=None):
+    """
+    List the distinct sources in the collection (of chunks matching the
+    `where` metadata filter, if given), in first-seen order.
+    
+    Only metadata is read, a page at a time, so memory stays flat on large
+    collections; the scan stops as soon as `max_docs` matching sources are found.
+    """
+    if page_size is None:
+        page_size = EXTRACT_MODE["SCAN_PAGE_SIZE"]
+    
+    sources = []
+    seen = set()
+    offset = 0
+    
+    while True:
+        page = collection.get(where=where, include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        
+        for metadata in page["metadatas"]:
+            source = (metadata or {}).get("source")
+            if source is None or source in seen:
+                continue
+            seen.add(source)
+            if path_prefix and not source.startswith(path_prefix):
+                continue
+            if source_glob and not fnmatch.fnmatch(source, source_glob):
+                continue
+            sources.append(source)
+            if max_docs and len(sources) >= max_docs:
+                return sources
+    
+    return sources
+
+def prefilter_sources(sources, scores, top_n=None, min_score=None):
+    """
+    Keep the sources scoring at least `min_score`, and of those at most the
+    `top_n` best, in their original order
+    """
+    kept = [source for source in sources if min_score is None or scores.get(source, -1.0) >= min_score]
+    if top_n is not None and len(kept) > top_n:
+        best = set(sorted(kept, key=lambda source: scores.get(source, -1.0), reverse=True)[:top_n])
+        kept = [source for source in kept if source in best]
+    return kept
+
+def iter_documents_by_source(vectorstore, sources=None, fetch_batch=None, where=None, with_vectors=False):
+    """
+    Yield (source, [Document]) pairs one source at a time, or
+    (source, [Document], [vector]) with the stored embeddings if `with_vectors`.
+    
+    Chunks are fetched with a `where` filter on the selected sources only (a
+    few sources per request), so chunks that won't be processed are never read.
+    An extra `where` metadata filter narrows the chunks further (e.g. to some pages).
+    """
+    collection = vectorstore._collection
+    if sources is None:
+        sources = list_sources(collection, where=where)
+    if fetch_batch is None:
+        fetch_batch = EXTRACT_MODE["SOURCE_FETCH_BATCH"]
     
-    return docs_by_source
+    source_iter = iter(sources)
+    while True:
+        batch = list(islice(source_iter, fetch_batch))
+        if not batch:
+            return
+        batch_where = {"source": batch[0]} if len(batch) == 1 else {"source": {"$in": batch}}
+        if where is not None:
+            batch_where = {"$and": [batch_where, where]}
+        include = ["metadatas", "documents"] + (["embeddings"] if with_vectors else [])
+        with trace("extract.fetch_chunks"):
+            data = collection.get(where=batch_where, include=include)
+            grouped = group_chunks_by_source(data)
+        if not with_vectors:
+            for source in batch:
+                yield source, grouped.get(source, [])
+            continue
+        vectors_by_id = dict(zip(data["ids"], data["embeddings"]))
+        for source in batch:
+            chunks = grouped.get(source, [])
+            yield source, chunks, [vectors_by_id[chunk.id] for chunk in chunks]
 
-def extract_from_document(llm, document_chunks, extraction_query, map_prompt):
+def get_all_documents_by_source(vectorstore):
     """
-    Extract information from a single document's chunks (MAP phase)
+    Group all chunks by their source document, in document order
+    Returns: dict {source_path: [chunk text]}
+
+    Deprecated: reads the whole corpus at once. Use iter_documents_by_source(),
+    which streams (source, [Document]) pairs.
     """
-    # Combine chunks from the same document (limit to avoid overflow)
-    combined_content = "\n\n".join(document_chunks[:15])  # Reduced from 20 to 15
+    warnings.warn(
+        "get_all_documents_by_source() is deprecated, use iter_documents_by_source()",
+        DeprecationWarning, stacklevel=2
+    )
+    return {
+        source: [doc.page_content for doc in chunks]
+        for source, chunks in iter_documents_by_source(vectorstore)
+    }
+
+def select_relevant_chunks(document_chunks, chunk_vectors, query_vector, max_tokens=None):
+    """
+    Keep the chunks most similar to the query that fit in `max_tokens`
+    (defaults to EXTRACT_MODE["MAP_RELEVANT_TOKENS"]), using their stored
+    embeddings. The kept chunks stay in document order.
+    """
+    if max_tokens is None:
+        max_tokens = EXTRACT_MODE["MAP_RELEVANT_TOKENS"]
+    if not document_chunks:
+        return []
     
-    # Truncate if too long
-    if len(combined_content) > 5000:  # Reduced from 6000
-        combined_content = combined_content[:5000] + "..."
+    scores = cosine_similarities(query_vector, chunk_vectors)
+    kept = []
+    used = 0
+    for index in np.argsort(-scores, kind="stable"):
+        tokens = estimate_tokens(document_chunks[index].page_content)
+        if kept and used + tokens > max_tokens:
+            # Smaller, less similar chunks may still fit
+            continue
+        kept.append(index)
+        used += tokens
+    return [document_chunks[index] for index in sorted(kept)]
+
+def build_map_windows(document_chunks, strategy=None, window_tokens=None):
+    """
+    Split one document's chunks into MAP prompt contexts.
+    
+    "windows": all chunks, de-overlapped and packed into token-budgeted windows
+    "relevant": same packing; the chunks are expected to be narrowed down
+    first by select_relevant_chunks()
+    "first_chunks": legacy behaviour, first 15 chunks cut at 5,000 characters
+    """
+    if strategy is None:
+        strategy = EXTRACT_MODE["MAP_STRATEGY"]
+    if window_tokens is None:
+        window_tokens = EXTRACT_MODE["MAP_WINDOW_TOKENS"]
     
+    if strategy == "first_chunks":
+        combined_content = "\n\n".join(doc.page_content for doc in document_chunks[:15])
+        if len(combined_content) > 5000:
+            combined_content = combined_content[:5000] + "..."
+        return [combined_content]
+    
+    segments = merge_overlapping_chunks(document_chunks)
+    # An empty document still gets one call, so it is reported as "Not mentioned"
+    return pack_windows(segments, window_tokens) or [""]
+
+def extract_from_window(llm, context, extraction_query, map_prompt):
+    """
+    Extract information from one window of a document (single MAP call)
+    """
     prompt = PromptTemplate(
         input_variables=["extraction_query", "context"],
         template=map_prompt
@@ -49,26 +204,98 @@ def extract_from_document(llm, document_chunks, extraction_query, map_prompt):
     
     formatted_prompt = prompt.format(
         extraction_query=extraction_query,
-        context=combined_content
+        context=context
     )
     
-    result = llm.invoke(formatted_prompt)
+    with trace("extract.map_call"):
+        result = llm.invoke(formatted_prompt)
     return result
 
-def reduce_extractions(llm, extractions, extraction_query, reduce_prompt):
+def merge_window_extractions(llm, window_extractions, extraction_query, reduce_prompt):
     """
-    Combine and deduplicate extracted information (REDUCE phase)
+    Merge the extractions of one document's windows into a per-document result
+    """
+    if len(window_extractions) == 1:
+        return window_extractions[0]
+    
+    total = len(window_extractions)
+    parts = {
+        f"part {i} of {total}": extraction
+        for i, extraction in enumerate(window_extractions, 1)
+    }
+    return reduce_extractions(llm, parts, extraction_query, reduce_prompt)
+
+def extract_from_document(llm, document_chunks, extraction_query, map_prompt, reduce_prompt=None,
+                          chunk_vectors=None, query_vector=None, strategy=None):
     """
-    # Combine all extractions
+    Extract information from a single document's chunks (MAP phase):
+    every window is extracted, then the window results are merged.
+    
+    `document_chunks` are Documents or plain chunk texts, in document order.
+    With the "relevant" strategy, `chunk_vectors` (the chunks' stored
+    embeddings) and `query_vector` (the embedded extraction query) select
+    the chunks that are read.
+    Standalone helper for one document; extract_from_all_documents() uses
+    run_map_phase(), which spreads the windows of many documents over workers.
+    """
+    document_chunks = [
+        chunk if isinstance(chunk, Document) else Document(page_content=chunk)
+        for chunk in document_chunks
+    ]
+    if reduce_prompt is None:
+        reduce_prompt = EXTRACT_MODE["REDUCE_PROMPT_TEMPLATE"]
+    if strategy is None:
+        strategy = EXTRACT_MODE["MAP_STRATEGY"]
+    if strategy == "relevant":
+        if chunk_vectors is None or query_vector is None:
+            raise ValueError('MAP_STRATEGY "relevant" needs chunk_vectors and query_vector')
+        document_chunks = select_relevant_chunks(document_chunks, chunk_vectors, query_vector)
+    
+    window_extractions = [
+        extract_from_window(llm, window, extraction_query, map_prompt)
+        for window in build_map_windows(document_chunks, strategy)
+    ]
+    return merge_window_extractions(llm, window_extractions, extraction_query, reduce_prompt)
+
+def make_reduce_batches(items, batch_size, max_chars):
+    """
+    Group (label, text) items into consecutive batches of at most `batch_size`
+    items and roughly `max_chars` characters each
+    """
+    batches = []
+    current = []
+    current_len = 0
+    
+    for label, text in items:
+        entry_len = len(label) + len(text) + 12
+        if current and (len(current) >= batch_size or current_len + entry_len > max_chars):
+            batches.append(current)
+            current = []
+            current_len = 0
+        current.append((label, text))
+        current_len += entry_len
+    
+    if current:
+        batches.append(current)
+    return batches
+
+def reduce_batch(llm, items, extraction_query, reduce_prompt, max_chars):
+    """
+    Combine and deduplicate one batch of (label, text) extractions with a single LLM call
+    """
+    # Only oversized entries get cut, each to its share of the budget
+    per_entry = max(500, max_chars // max(1, len(items)))
+    if sum(len(text) for _, text in items) > max_chars:
+        items = [
+            (label, text if len(text) <= per_entry else text[:per_entry] + "\n[... truncated for length ...]")
+            for label, text in items
+        ]
+    
     combined_extractions = "\n\n---\n\n".join([
-        f"From {source.split('/')[-1]}:\n{extraction}" 
-        for source, extraction in extractions.items()
+        f"From {label}:\n{text}" 
+        for label, text in items
     ])
     
-    # Truncate if too long
-    if len(combined_extractions) > 8000:  # Reduced from 10000
-        combined_extractions = combined_extractions[:8000] + "\n\n[... truncated for length ...]"
-    
     prompt = PromptTemplate(
         input_variables=["extraction_query", "summaries"],
         template=reduce_prompt
@@ -79,10 +306,283 @@ def reduce_extractions(llm, extractions, extraction_query, reduce_prompt):
         summaries=combined_extractions
     )
     
-    result = llm.invoke(formatted_prompt)
+    with trace("extract.reduce_call"):
+        result = llm.invoke(formatted_prompt)
     return result
 
-def extract_from_all_documents(extraction_query, output_file=None, verbose=True, max_docs=None):
+def reduce_extractions(llm, extractions, extraction_query, reduce_prompt,
+                       batch_size=None, max_chars=None, workers=1, verbose=False):
+    """
+    Combine and deduplicate extracted information (REDUCE phase)
+    
+    Extractions are reduced as a tree: they are grouped into context-sized
+    batches, each batch is reduced (batches run concurrently), and the partial
+    results are reduced again until one remains. Every extraction reaches the
+    LLM, and the number of levels grows logarithmically with document count.
+    """
+    if batch_size is None:
+        batch_size = EXTRACT_MODE["BATCH_SIZE"]
+    if max_chars is None:
+        max_chars = EXTRACT_MODE["REDUCE_MAX_CHARS"]
+    batch_size = max(2, batch_size)
+    
+    items = [(source.split('/')[-1], extraction) for source, extraction in extractions.items()]
+    if len(items) <= 1:
+        # Nothing to merge, but still let the LLM structure the single result
+        return reduce_batch(llm, items, extraction_query, reduce_prompt, max_chars)
+    
+    level = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while len(items) > 1:
+            level += 1
+            batches = make_reduce_batches(items, batch_size, max_chars)
+            if len(batches) == len(items):
+                # Every item fills a batch on its own: pair them so the tree still shrinks
+                batches = [items[i:i + 2] for i in range(0, len(items), 2)]
+            
+            if verbose:
+                print(f"Level {level}: reducing {len(items)} extractions in {len(batches)} batches")
+            
+            futures = [
+                executor.submit(reduce_batch, llm, batch, extraction_query, reduce_prompt, max_chars)
+                if len(batch) > 1 else None
+                for batch in batches
+            ]
+            items = [
+                batch[0] if future is None else (f"combined group {level}.{n}", future.result())
+                for n, (batch, future) in enumerate(zip(batches, futures), 1)
+            ]
+    
+    return items[0][1]
+
+def make_query_key(extraction_query, map_prompt, strategy=None):
+    """Hash identifying an extraction run: same query, prompt, model and windowing => same results"""
+    if strategy is None:
+        strategy = EXTRACT_MODE["MAP_STRATEGY"]
+    parts = [LLM_MODEL, map_prompt, extraction_query, strategy, str(EXTRACT_MODE["MAP_WINDOW_TOKENS"])]
+    if strategy == "relevant":
+        parts.append(str(EXTRACT_MODE["MAP_RELEVANT_TOKENS"]))
+    key = "\0".join(parts)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def make_chunk_set_hash(chunks):
+    """Order-independent hash of a source's chunk texts"""
+    digest = hashlib.sha256()
+    for text in sorted(chunk.page_content for chunk in chunks):
+        digest.update(text.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+class ExtractionCheckpoint:
+    """
+    Append-only JSONL file of completed MAP results.
+
+    Each line is keyed by query hash + source + chunk-set hash, so a result is
+    only reused for the same query against the same indexed content.
+    """
+
+    def __init__(self, path, query_key, resume=False):
+        self.path = path
+        self.query_key = query_key
+        self.done = {}
+        
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written last line from a crash
+                    if record.get("query_key") == query_key:
+                        self.done[(record["source"], record["chunk_hash"])] = record["extraction"]
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a" if resume else "w")
+    
+    def get(self, source, chunk_hash):
+        """Return the checkpointed extraction, or None"""
+        return self.done.get((source, chunk_hash))
+    
+    def record(self, source, chunk_hash, extraction):
+        """Durably append one completed extraction"""
+        record = {
+            "query_key": self.query_key,
+            "source": source,
+            "chunk_hash": chunk_hash,
+            "extraction": extraction,
+        }
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done[(source, chunk_hash)] = extraction
+    
+    def close(self):
+        self._file.close()
+
+def get_checkpoint_path(query_key):
+    """Default checkpoint file for an extraction query"""
+    return os.path.join(EXTRACT_MODE["CHECKPOINT_DIR"], f"{query_key}.jsonl")
+
+def _timed(func, *args):
+    """Run one LLM call and measure its own duration (not time spent queued)"""
+    call_start = time.time()
+    result = func(*args)
+    return result, time.time() - call_start
+
+def run_map_phase(llm, documents, extraction_query, map_prompt, reduce_prompt=None,
+                  workers=1, verbose=True, checkpoint=None, total=None, strategy=None):
+    """
+    Extract from every source (MAP phase) with at most `workers` LLM calls in flight.
+    
+    `documents` is a dict or an iterable of (source, chunks) pairs; it is
+    consumed lazily, so only the documents currently being worked on are held
+    in memory. Each document is split into windows and the windows of all
+    documents share the worker pool, so one large document doesn't stall the
+    others. Once all windows of a document are done they are merged into its result.
+    Sources already present in `checkpoint` are skipped; new results are appended to it.
+    Returns: dict {source: extraction} in the order the sources were given
+    """
+    if reduce_prompt is None:
+        reduce_prompt = EXTRACT_MODE["REDUCE_PROMPT_TEMPLATE"]
+    if isinstance(documents, dict):
+        if total is None:
+            total = len(documents)
+        documents = documents.items()
+    workers = max(1, workers)
+    
+    order = []
+    results = {}
+    chunk_hashes = {}
+    # Per-document progress: window results, calls still outstanding, LLM time spent
+    state = {}
+    units = deque()
+    doc_iter = iter(documents)
+    start_time = time.time()
+    completed = 0
+    resumed = 0
+    
+    def next_unit():
+        nonlocal completed, resumed
+        while not units:
+            item = next(doc_iter, None)
+            if item is None:
+                return None
+            source, chunks = item
+            order.append(source)
+            
+            if checkpoint is not None:
+                chunk_hashes[source] = make_chunk_set_hash(chunks)
+                previous = checkpoint.get(source, chunk_hashes[source])
+                if previous is not None:
+                    results[source] = previous
+                    completed += 1
+                    resumed += 1
+                    continue
+            
+            windows = build_map_windows(chunks, strategy)
+            state[source] = {"parts": [None] * len(windows), "remaining": len(windows), "time": 0.0, "error": None}
+            units.extend((source, index, window) for index, window in enumerate(windows))
+        return units.popleft()
+    
+    def finish(source, extraction=None, error=None):
+        nonlocal completed
+        completed += 1
+        doc = state.pop(source)
+        if error is None:
+            results[source] = extraction
+            if checkpoint is not None:
+                checkpoint.record(source, chunk_hashes[source], extraction)
+        else:
+            # One failing document must not abort the whole run (and is retried on resume)
+            results[source] = f"Error: {str(error)}"
+        
+        if not verbose:
+            return
+        filename = source.split('/')[-1]
+        progress = f"{completed}/{total}" if total else f"{completed}"
+        print(f"[{progress}] Processed: {filename[:60]}")
+        if error is not None:
+            print(f"    Error: {error}")
+        else:
+            # Show preview and timing
+            preview = extraction[:100].replace('\n', ' ')
+            windows_note = f" ({len(doc['parts'])} windows)" if len(doc['parts']) > 1 else ""
+            print(f"    Time: {doc['time']:.1f}s{windows_note} | Preview: {preview}...")
+        
+        # Estimate remaining time from observed throughput (accounts for concurrency)
+        if total:
+            avg_time = (time.time() - start_time) / max(1, completed - resumed)
+            remaining = avg_time * (total - completed)
+            print(f"    ETA: {remaining/60:.1f} minutes remaining")
+        print()
+    
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {}
+        ready_merges = deque()
+        
+        def fill():
+            # Merges first (they complete a document), then new windows
+            while len(pending) < workers:
+                if ready_merges:
+                    source = ready_merges.popleft()
+                    future = executor.submit(
+                        _timed, merge_window_extractions,
+                        llm, state[source]["parts"], extraction_query, reduce_prompt
+                    )
+                    pending[future] = (source, None)
+                    continue
+                unit = next_unit()
+                if unit is None:
+                    return
+                source, index, window = unit
+                future = executor.submit(_timed, extract_from_window, llm, window, extraction_query, map_prompt)
+                pending[future] = (source, index)
+        
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, index = pending.pop(future)
+                doc = state[source]
+                try:
+                    result, call_time = future.result()
+                    doc["time"] += call_time
+                except Exception as e:
+                    result, doc["error"] = None, e
+                
+                if index is None:
+                    # Per-document merge finished
+                    finish(source, result, doc["error"])
+                    continue
+                
+                doc["parts"][index] = result
+                doc["remaining"] -= 1
+                if doc["remaining"] == 0:
+                    if doc["error"] is not None:
+                        finish(source, error=doc["error"])
+                    elif len(doc["parts"]) == 1:
+                        finish(source, doc["parts"][0])
+                    else:
+                        ready_merges.append(source)
+            fill()
+    except KeyboardInterrupt:
+        # Don't wait for queued work; everything completed so far is checkpointed
+        executor.shutdown(wait=False, cancel_futures=True)
+        if verbose and checkpoint is not None:
+            print(f"\nInterrupted. {len(checkpoint.done)} results saved to {checkpoint.path}; rerun with --resume.")
+        raise
+    executor.shutdown()
+    
+    if verbose and resumed:
+        print(f"Resumed {resumed} documents from checkpoint\n")
+    
+    # Deterministic output order, independent of completion order
+    return {source: results[source] for source in order}
+
+def extract_from_all_documents(extraction_query, output_file=None, verbose=True, max_docs=None, workers=None,
+                               resume=False, checkpoint_file=None, source_prefix=None, source_glob=None,
+                               collection=None, filters=None, top_n=None, min_score=None, map_strategy=None):
     """
     Main extraction function - processes all documents systematically
     
@@ -91,8 +591,28 @@ def extract_from_all_documents(extraction_query, output_file=None, verbose=True,
         output_file: Optional file path to save results
         verbose: Print progress
         max_docs: Limit number of documents to process (for testing)
+        workers: Number of concurrent MAP calls (defaults to EXTRACT_MODE["WORKERS"])
+        resume: Reuse MAP results from a previous (interrupted) run of the same query
+        checkpoint_file: Checkpoint JSONL path (defaults to one file per query in EXTRACT_MODE["CHECKPOINT_DIR"])
+        source_prefix: Only process sources whose path starts with this prefix
+        source_glob: Only process sources whose path matches this glob (e.g. "*.pdf")
+        collection: Collection to extract from (default: COLLECTION_NAME)
+        filters: Metadata filter expressions, e.g. ["file_type=pdf", "mtime>=2024-01-01"]
+        top_n: Only process the N sources most similar to the query (defaults to EXTRACT_MODE["PREFILTER_TOP_N"])
+        min_score: Only process sources at least this similar to the query (defaults to EXTRACT_MODE["PREFILTER_MIN_SCORE"])
+        map_strategy: "windows", "relevant" or "first_chunks" (defaults to EXTRACT_MODE["MAP_STRATEGY"])
     """
     config = get_mode_config("extract")
+    if workers is None:
+        workers = config["WORKERS"]
+    if top_n is None:
+        top_n = config["PREFILTER_TOP_N"]
+    if min_score is None:
+        min_score = config["PREFILTER_MIN_SCORE"]
+    prefilter = top_n is not None or min_score is not None
+    if map_strategy is None:
+        map_strategy = config["MAP_STRATEGY"]
+    relevant = map_strategy == "relevant"
     
     if verbose:
         print("=" * 80)
@@ -100,72 +620,114 @@ def extract_from_all_documents(extraction_query, output_file=None, verbose=True,
         print("=" * 80)
         print(f"Extraction query: {extraction_query}")
         print(f"Temperature: {config['TEMPERATURE']}")
+        print(f"Workers: {workers}")
         if max_docs:
             print(f"Max documents: {max_docs}")
+        if source_prefix:
+            print(f"Source prefix: {source_prefix}")
+        if source_glob:
+            print(f"Source glob: {source_glob}")
+        if collection:
+            print(f"Collection: {collection}")
+        if filters:
+            print(f"Filters: {', '.join(filters)}")
+        if prefilter:
+            limits = [f"top {top_n}"] if top_n is not None else []
+            limits += [f"score >= {min_score}"] if min_score is not None else []
+            print(f"Pre-filter: {', '.join(limits)}")
+        if relevant:
+            print(f"MAP strategy: relevant (best chunks up to {config['MAP_RELEVANT_TOKENS']} tokens per document)")
+        elif map_strategy != "windows":
+            print(f"MAP strategy: {map_strategy}")
         print("=" * 80 + "\n")
     
     # Initialize
-    embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
-    vectorstore = Chroma(
-        persist_directory=VECTOR_DB_PATH,
-        embedding_function=embeddings
-    )
+    collection = collection or COLLECTION_NAME
+    where = None
+    if filters:
+        index_dir = get_collection_dir(VECTOR_DB_PATH, collection)
+        where = build_where(filters, load_manifest(index_dir)["files"] if needs_manifest(filters) else ())
+    embeddings = get_embeddings()
+    vectorstore = open_vectorstore(embeddings, collection)
     
     llm = OllamaLLM(model=LLM_MODEL, temperature=config["TEMPERATURE"])
+    # Embedded once, shared by the pre-filter and relevant-chunk selection
+    query_vector = embeddings.embed_query(extraction_query) if prefilter or relevant else None
     
-    # Get all documents grouped by source
+    # Find the sources to process (metadata only); their chunks are streamed during MAP
     if verbose:
-        print("Loading documents from database...")
-    docs_by_source = get_all_documents_by_source(vectorstore)
+        print("Scanning document sources in database...")
+    with trace("extract.list_sources"):
+        sources = list_sources(
+            vectorstore._collection,
+            path_prefix=source_prefix,
+            source_glob=source_glob,
+            # With the pre-filter, --max-docs applies to the documents it selects
+            max_docs=None if prefilter else max_docs,
+            where=where
+        )
     
-    # Limit documents if specified
-    if max_docs and max_docs < len(docs_by_source):
-        docs_by_source = dict(list(docs_by_source.items())[:max_docs])
+    prefilter_report = None
+    if prefilter:
+        if verbose:
+            print("Scoring documents against the extraction query...")
+        with trace("extract.prefilter"):
+            scores = score_sources(
+                vectorstore._collection, query_vector,
+                best_chunks=config["PREFILTER_BEST_CHUNKS"], where=where, page_size=config["SCAN_PAGE_SIZE"]
+            )
+            selected = prefilter_sources(sources, scores, top_n, min_score)[:max_docs]
+        prefilter_report = {
+            "top_n": top_n,
+            "min_score": min_score,
+            "candidates": len(sources),
+            "selected": len(selected),
+            "skipped": len(sources) - len(selected),
+            "lowest_selected_score": round(min(scores.get(source, -1.0) for source in selected), 4) if selected else None,
+        }
+        if verbose:
+            print(f"Pre-filter: {len(selected)} of {len(sources)} documents selected, "
+                  f"{prefilter_report['skipped']} skipped"
+                  + (f" (lowest selected score {prefilter_report['lowest_selected_score']:.3f})" if selected else ""))
+        sources = selected
     
     if verbose:
-        print(f"Processing {len(docs_by_source)} documents\n")
+        print(f"Processing {len(sources)} documents\n")
         print("=" * 80)
         print("MAP PHASE: Extracting from each document")
         print("=" * 80 + "\n")
     
-    # MAP phase: Extract from each document
-    extractions = {}
+    # MAP phase: Extract from each document (checkpointed as results complete)
     start_time = time.time()
-    
-    for i, (source, chunks) in enumerate(docs_by_source.items(), 1):
-        doc_start = time.time()
-        
-        if verbose:
-            filename = source.split('/')[-1]
-            print(f"[{i}/{len(docs_by_source)}] Processing: {filename[:60]}")
-        
-        try:
-            extraction = extract_from_document(
-                llm, 
-                chunks, 
+    query_key = make_query_key(extraction_query, config["MAP_PROMPT_TEMPLATE"], map_strategy)
+    checkpoint = ExtractionCheckpoint(
+        checkpoint_file or get_checkpoint_path(query_key),
+        query_key,
+        resume=resume
+    )
+    documents = iter_documents_by_source(vectorstore, sources, where=where, with_vectors=relevant)
+    if relevant:
+        # Only each document's chunks closest to the query reach the MAP prompt
+        documents = (
+            (source, select_relevant_chunks(chunks, vectors, query_vector))
+            for source, chunks, vectors in documents
+        )
+    try:
+        with trace("extract.map_phase"):
+            extractions = run_map_phase(
+                llm,
+                documents,
                 extraction_query,
-                config["MAP_PROMPT_TEMPLATE"]
+                config["MAP_PROMPT_TEMPLATE"],
+                config["REDUCE_PROMPT_TEMPLATE"],
+                workers=workers,
+                verbose=verbose,
+                checkpoint=checkpoint,
+                total=len(sources),
+                strategy=map_strategy
             )
-            extractions[source] = extraction
-            
-            doc_time = time.time() - doc_start
-            
-            if verbose:
-                # Show preview and timing
-                preview = extraction[:100].replace('\n', ' ')
-                print(f"    Time: {doc_time:.1f}s | Preview: {preview}...")
-                
-                # Estimate remaining time
-                avg_time = (time.time() - start_time) / i
-                remaining = avg_time * (len(docs_by_source) - i)
-                print(f"    ETA: {remaining/60:.1f} minutes remaining")
-                
-        except Exception as e:
-            if verbose:
-                print(f"    Error: {e}")
-            extractions[source] = f"Error: {str(e)}"
-        
-        print()
+    finally:
+        checkpoint.close()
     
     # REDUCE phase: Combine all extractions
     if verbose:
@@ -174,12 +736,17 @@ def extract_from_all_documents(extraction_query, output_file=None, verbose=True,
         print("=" * 80 + "\n")
     
     try:
-        final_result = reduce_extractions(
-            llm,
-            extractions,
-            extraction_query,
-            config["REDUCE_PROMPT_TEMPLATE"]
-        )
+        with trace("extract.reduce_phase"):
+            final_result = reduce_extractions(
+                llm,
+                extractions,
+                extraction_query,
+                config["REDUCE_PROMPT_TEMPLATE"],
+                batch_size=config["BATCH_SIZE"],
+                max_chars=config["REDUCE_MAX_CHARS"],
+                workers=workers,
+                verbose=verbose
+            )
     except Exception as e:
         if verbose:
             print(f"Error in reduce phase: {e}")
@@ -189,10 +756,12 @@ def extract_from_all_documents(extraction_query, output_file=None, verbose=True,
     if output_file:
         output_data = {
             "extraction_query": extraction_query,
-            "total_documents": len(docs_by_source),
+            "total_documents": len(sources),
             "individual_extractions": {k.split('/')[-1]: v for k, v in extractions.items()},
             "final_result": final_result
         }
+        if prefilter_report:
+            output_data["prefilter"] = prefilter_report
         
         with open(output_file, 'w') as f:
             json.dump(output_data, f, indent=2)
@@ -207,7 +776,8 @@ def extract_from_all_documents(extraction_query, output_file=None, verbose=True,
     return {
         "query": extraction_query,
         "individual_extractions": extractions,
-        "final_result": final_result
+        "final_result": final_result,
+        "prefilter": prefilter_report
     }
 
 if __name__ == "__main__":
@@ -224,6 +794,21 @@ Examples:
   # Extract health effects from all docs and save to file
   python extract_documents.py "What health effects are described?" -o results.json
   
+  # Run 4 documents at a time (Ollama started with OLLAMA_NUM_PARALLEL=4)
+  python extract_documents.py "List all chemicals mentioned" --workers 4 -o chemicals.json
+  
+  # Continue an interrupted run without redoing finished documents
+  python extract_documents.py "List all chemicals mentioned" -o chemicals.json --resume
+  
+  # Only the 50 documents most relevant to the query (no LLM calls for the rest)
+  python extract_documents.py "List all chemicals mentioned" --top-docs 50 -o chemicals.json
+  
+  # Read only the passages of each document closest to the query (one short MAP call per document)
+  python extract_documents.py "List all chemicals mentioned" --map-strategy relevant -o chemicals.json
+  
+  # Only PDFs from one project folder
+  python extract_documents.py "List all chemicals mentioned" --source-prefix /data/pouches/ --source-glob "*.pdf"
+  
   # Extract authors and publication info (quiet mode)
   python extract_documents.py "Extract: authors, publication date, journal name" -o metadata.json -q
         """
@@ -233,6 +818,25 @@ Examples:
     parser.add_argument('-o', '--output', help='Output file to save results (JSON format)')
     parser.add_argument('-q', '--quiet', action='store_true', help='Minimal output')
     parser.add_argument('--max-docs', type=int, help='Limit number of documents to process (for testing)')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Concurrent LLM calls in the MAP phase (match OLLAMA_NUM_PARALLEL on the Ollama host)')
+    parser.add_argument('--source-prefix', help='Only process documents whose path starts with this prefix')
+    parser.add_argument('--source-glob', help='Only process documents whose path matches this glob (e.g. "*.pdf")')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip documents already extracted by a previous run of the same query')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: one JSONL file per query in EXTRACT_MODE["CHECKPOINT_DIR"])')
+    parser.add_argument('--collection', help=f'Collection to extract from (default: {COLLECTION_NAME})')
+    parser.add_argument('--where', action='append', metavar='FILTER',
+                       help='Only process chunks matching a metadata filter (e.g. file_type=pdf, mtime>=2024-01-01); repeatable')
+    parser.add_argument('--top-docs', type=int, default=None,
+                       help='Only extract from the N documents most similar to the query (pre-filter on stored embeddings)')
+    parser.add_argument('--min-score', type=float, default=None,
+                       help='Only extract from documents whose best chunks reach this similarity to the query (e.g. 0.5)')
+    parser.add_argument('--map-strategy', choices=['windows', 'relevant', 'first_chunks'], default=None,
+                       help='How much of each document the MAP phase reads: all of it in windows, only the chunks '
+                            'most similar to the query (MAP_RELEVANT_TOKENS), or the first 15 chunks '
+                            '(default: EXTRACT_MODE["MAP_STRATEGY"])')
+    parser.add_argument('--profile', action='store_true', help='Print time spent per stage at the end')
     
     args = parser.parse_args()
     
@@ -240,7 +844,17 @@ Examples:
         args.query, 
         output_file=args.output,
         verbose=not args.quiet,
-        max_docs=args.max_docs
+        max_docs=args.max_docs,
+        workers=args.workers,
+        resume=args.resume,
+        checkpoint_file=args.checkpoint,
+        source_prefix=args.source_prefix,
+        source_glob=args.source_glob,
+        collection=args.collection,
+        filters=args.where,
+        top_n=args.top_docs,
+        min_score=args.min_score,
+        map_strategy=args.map_strategy
     )
     
     print("\n" + "=" * 80)
@@ -248,3 +862,6 @@ Examples:
     print("=" * 80 + "\n")
     print(result["final_result"])
     print("\n" + "=" * 80)
+    
+    if args.profile:
+        print("\n" + format_profile())
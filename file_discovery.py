@@ -0,0 +1,131 @@
+"""
+Fast discovery of the files to index.
+
+Walks each document folder with os.scandir, prunes excluded directories
+before descending into them, and applies INCLUDE_PATTERNS, EXCLUDE_PATTERNS
+and MAX_FILE_AGE_DAYS from config.py. Hidden files and folders (names
+starting with ".", e.g. macOS "._*" AppleDouble files) are always skipped.
+Files are yielded lazily so parsing can start while a slow network share is
+still being scanned.
+"""
+
+import os
+import re
+import time
+from config import INCLUDE_PATTERNS, EXCLUDE_PATTERNS, MAX_FILE_AGE_DAYS
+
+def glob_to_regex(pattern):
+    """
+    Compile a glob with ** support ("**/" matches zero or more folders)
+    into a case-insensitive regex matched against '/'-separated relative paths
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r"\Z", re.IGNORECASE)
+
+def get_age_cutoff(max_age_days=MAX_FILE_AGE_DAYS):
+    """Oldest mtime still processed, or None when there is no age limit"""
+    if not max_age_days:
+        return None
+    return time.time() - max_age_days * 86400
+
+def new_discovery_stats():
+    return {"dirs": 0, "files": 0, "matched": 0, "pruned_dirs": 0, "excluded": 0, "too_old": 0, "seconds": 0.0}
+
+def discover_files(root, include=INCLUDE_PATTERNS, exclude=EXCLUDE_PATTERNS,
+                   max_age_days=MAX_FILE_AGE_DAYS, stats=None):
+    """
+    Yield (path, stat_result) for every non-hidden file under `root` that
+    matches the include patterns, no exclude pattern, and the age limit. Counters are
+    accumulated into `stats` (see new_discovery_stats).
+    """
+    if stats is None:
+        stats = new_discovery_stats()
+    include_res = [glob_to_regex(p) for p in include]
+    exclude_res = [glob_to_regex(p) for p in exclude]
+    cutoff = get_age_cutoff(max_age_days)
+
+    # Only time spent scanning counts, not time the caller spends between files
+    started = time.time()
+    stack = [(root, "")]
+    try:
+        while stack:
+            directory, rel_dir = stack.pop()
+            stats["dirs"] += 1
+            try:
+                entries = sorted(os.scandir(directory), key=lambda e: e.name)
+            except OSError as e:
+                print(f"Warning: cannot read {directory}: {e}")
+                continue
+
+            subdirs = []
+            for entry in entries:
+                rel_path = f"{rel_dir}{entry.name}"
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                hidden = entry.name.startswith(".")
+                if is_dir:
+                    # "**/.git/**"-style patterns match the folder path plus "/"
+                    if hidden or any(r.match(rel_path + "/") for r in exclude_res):
+                        stats["pruned_dirs"] += 1
+                    else:
+                        subdirs.append((entry.path, rel_path + "/"))
+                    continue
+
+                if not entry.is_file():
+                    continue
+                stats["files"] += 1
+
+                if hidden:
+                    stats["excluded"] += 1
+                    continue
+                if include_res and not any(r.match(rel_path) for r in include_res):
+                    stats["excluded"] += 1
+                    continue
+                if any(r.match(rel_path) for r in exclude_res):
+                    stats["excluded"] += 1
+                    continue
+
+                stat = entry.stat()
+                if cutoff is not None and stat.st_mtime < cutoff:
+                    stats["too_old"] += 1
+                    continue
+
+                stats["matched"] += 1
+                stats["seconds"] += time.time() - started
+                started = None
+                yield entry.path, stat
+                started = time.time()
+
+            # Depth-first, in name order
+            stack.extend(reversed(subdirs))
+    finally:
+        if started is not None:
+            stats["seconds"] += time.time() - started
+
+def format_discovery_stats(stats):
+    return (
+        f"Discovery: {stats['files']} files in {stats['dirs']} folders scanned, "
+        f"{stats['matched']} matched, {stats['excluded']} excluded by pattern, "
+        f"{stats['too_old']} too old, {stats['pruned_dirs']} folders pruned "
+        f"({stats['seconds']:.1f}s)"
+    )
@@ -0,0 +1,74 @@
+"""
+Persistent manifest of indexed files.
+
+Each collection has a manifest in its folder (see namespaces.py) mapping every
+indexed file to its size, mtime, content hash, root folder and the IDs of the
+chunks it produced, so that process_docs.py only re-embeds files that
+actually changed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_FORMAT = 2  # 2: chunks carry root, file_type and mtime metadata
+
+def get_manifest_path(db_path):
+    """Return the manifest location for a vector store directory"""
+    return os.path.join(db_path, MANIFEST_FILENAME)
+
+def load_manifest(db_path):
+    """
+    Load the manifest for a vector store
+    Returns: dict {"format", "index_version", "files": {path: entry}}
+    """
+    path = get_manifest_path(db_path)
+    if not os.path.exists(path):
+        return {"format": MANIFEST_FORMAT, "index_version": 0, "files": {}}
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    manifest.setdefault("format", 1)
+    manifest.setdefault("index_version", 0)
+    manifest.setdefault("files", {})
+    return manifest
+
+def save_manifest(db_path, manifest):
+    """Atomically write the manifest (a crash never leaves a half-written file)"""
+    os.makedirs(db_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=db_path, prefix=".manifest-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, get_manifest_path(db_path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def get_index_version(db_path):
+    """Return the index version counter (bumped whenever the index changes)"""
+    return load_manifest(db_path)["index_version"]
+
+def file_signature(stat):
+    """Cheap change detection: (size, mtime) from the stat_result file discovery already made"""
+    return stat.st_size, stat.st_mtime
+
+def hash_file(path, block_size=1 << 20):
+    """SHA-256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_chunk_ids(path, content_hash, count):
+    """
+    Deterministic chunk IDs for a file version.
+    The path is part of the key so identical files in two folders don't collide.
+    """
+    prefix = hashlib.sha1(f"{path}\0{content_hash}".encode()).hexdigest()[:20]
+    return [f"{prefix}-{i}" for i in range(count)]
@@ -0,0 +1,279 @@
+"""
+Local BM25 inverted index and hybrid (lexical + vector) retrieval.
+
+Dense search alone tends to miss exact identifiers such as chemical names and
+CAS numbers. process_docs.py therefore also writes every chunk into a small
+SQLite inverted index next to the vector store, updated file by file like the
+vector store itself. The "hybrid" RETRIEVAL_SEARCH_TYPE ranks chunks with both
+BM25 and vector similarity and fuses the two rankings with reciprocal-rank
+fusion (RRF).
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+from config import BM25_K1, BM25_B, BM25_MAX_TERM_SHARE, HYBRID_RRF_K
+from tracing import trace
+
+LEXICAL_INDEX_FILENAME = "lexical_index.sqlite"
+# Posting lists shorter than this are cheap to score, so small indexes use every query term
+MIN_SKIPPED_DF = 1000
+
+# Words joined by hyphens, commas or dots stay together ("54-11-5",
+# "2,4-dinitrotoluene", "n-nitrosonornicotine"); their parts are indexed too
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-,.'][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can did do does for from had has have how i if in into is it its
+me my no not of on or our so such than that the their them then there these they this those to was
+we were what when where which who whom why will with would you your
+""".split())
+
+def get_lexical_index_path(db_path):
+    """Return the lexical index location for a vector store directory"""
+    return os.path.join(db_path, LEXICAL_INDEX_FILENAME)
+
+def tokenize(text):
+    """Lower-cased terms of a text, keeping compound identifiers intact"""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        terms.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part not in STOP_WORDS)
+    return terms
+
+class LexicalIndex:
+    """SQLite inverted index over chunks, scored with BM25"""
+
+    def __init__(self, db_path):
+        os.makedirs(db_path, exist_ok=True)
+        self.path = get_lexical_index_path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, source TEXT NOT NULL, length INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+            # Document frequency per term, so a query never counts a long posting list
+            self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+            if (self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0] == 0
+                    and self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0] > 0):
+                # Index built before the terms table existed
+                self._conn.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+            # Corpus totals for BM25, maintained on every add/delete
+            self._conn.execute("CREATE TABLE IF NOT EXISTS totals (chunks INTEGER NOT NULL, length INTEGER NOT NULL)")
+            if self._conn.execute("SELECT COUNT(*) FROM totals").fetchone()[0] == 0:
+                self._conn.execute("INSERT INTO totals VALUES (0, 0)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT chunks FROM totals").fetchone()[0]
+
+    def add_chunks(self, ids, texts, sources):
+        """Index chunks (replacing any with the same id) in one transaction"""
+        with self._lock, self._conn:
+            self._delete_ids(list(ids))
+            total_length = 0
+            for chunk_id, text, source in zip(ids, texts, sources):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                total_length += length
+                self._conn.execute("INSERT INTO chunks VALUES (?, ?, ?)", (chunk_id, source, length))
+                self._conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO terms VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts]
+                )
+            self._conn.execute("UPDATE totals SET chunks = chunks + ?, length = length + ?", (len(ids), total_length))
+
+    def _delete_ids(self, ids):
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            count, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchone()
+            if not count:
+                continue
+            removed = self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE chunk_id IN ({placeholders}) GROUP BY term", batch
+            ).fetchall()
+            self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in removed])
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._conn.execute("UPDATE totals SET chunks = chunks - ?, length = length - ?", (count, length))
+
+    def delete_source(self, source):
+        """Remove every chunk of a file"""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+            self._delete_ids(ids)
+
+    def rebuild_from(self, collection, page_size=5000):
+        """Index every chunk already in a Chroma collection (first run after upgrading)"""
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not batch["ids"]:
+                break
+            sources = [(metadata or {}).get("source", "") for metadata in batch["metadatas"]]
+            self.add_chunks(batch["ids"], batch["documents"], sources)
+            offset += len(batch["ids"])
+        return offset
+
+    def search(self, query, k):
+        """
+        BM25-rank chunks for a query
+        
+        Terms found in more than BM25_MAX_TERM_SHARE of the chunks (and at least
+        MIN_SKIPPED_DF chunks) are skipped: their idf is close to zero and their
+        posting lists are the longest. The rarest term is kept if all are common. Scores are summed and ranked in SQLite,
+        so only the best `k` rows come back.
+        Returns: list of (chunk_id, score), best first
+        """
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            total_chunks, total_length = self._conn.execute("SELECT chunks, length FROM totals").fetchone()
+            if not total_chunks:
+                return []
+            average_length = total_length / total_chunks or 1
+            placeholders = ",".join("?" * len(terms))
+            dfs = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({placeholders})", list(terms)
+            ).fetchall())
+            if not dfs:
+                return []
+            common = max(total_chunks * BM25_MAX_TERM_SHARE, MIN_SKIPPED_DF)
+            kept = [term for term in dfs if dfs[term] <= common] or [min(dfs, key=dfs.get)]
+
+            weights = []
+            for term in kept:
+                df = dfs[term]
+                idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+                weights += [term, terms[term] * idf]
+            values = ",".join(["(?, ?)"] * len(kept))
+            rows = self._conn.execute(
+                f"WITH query (term, weight) AS (VALUES {values}) "
+                "SELECT p.chunk_id, SUM(q.weight * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * c.length / ?))) AS score"
+                " FROM query q JOIN postings p ON p.term = q.term JOIN chunks c ON c.id = p.chunk_id"
+                " GROUP BY p.chunk_id ORDER BY score DESC, p.chunk_id LIMIT ?",
+                weights + [BM25_K1, BM25_K1, BM25_B, BM25_B, float(average_length), k]
+            ).fetchall()
+        return rows
+
+def reciprocal_rank_fusion(rankings, k=HYBRID_RRF_K):
+    """
+    Fuse several rankings (lists of ids, best first) into one
+    Returns: list of (id, fused score), best first
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return scores.most_common()
+
+class HybridRetriever:
+    """
+    Retriever for the "hybrid" search type: the top `fetch_k` chunks by BM25
+    and by vector similarity are fused with RRF and the best `k` returned.
+    Falls back to vector search alone when no lexical index has been built.
+    With a `where` metadata filter, lexical hits outside it are dropped before fusion.
+    Chunks in the BM25 ranking get a "lexical_rank" (1 = best) in their metadata.
+    """
+
+    def __init__(self, vectorstore, embeddings, lexical_index, k, fetch_k):
+        self.collection = vectorstore._collection
+        self.embeddings = embeddings
+        self.lexical_index = lexical_index
+        self.k = k
+        self.fetch_k = max(k, fetch_k)
+
+    def invoke_with_vectors(self, question, query_vector=None, where=None):
+        """
+        `query_vector` is the question's embedding, if already computed;
+        `where` is a Chroma metadata filter
+        Returns: (documents, their stored vectors)
+        """
+        if query_vector is None:
+            with trace("query.embedding"):
+                query_vector = self.embeddings.embed_query(question)
+        with trace("query.vector_search"):
+            dense = self.collection.query(
+                query_embeddings=[query_vector],
+                n_results=self.fetch_k,
+                where=where,
+                include=["documents", "metadatas", "embeddings"],
+            )
+        found = {
+            chunk_id: (Document(page_content=text, metadata=metadata or {}, id=chunk_id), vector)
+            for chunk_id, text, metadata, vector in zip(
+                dense["ids"][0], dense["documents"][0], dense["metadatas"][0], dense["embeddings"][0]
+            )
+        }
+        rankings = [dense["ids"][0]]
+        if self.lexical_index is not None:
+            with trace("query.lexical_search"):
+                lexical = [chunk_id for chunk_id, _ in self.lexical_index.search(question, self.fetch_k)]
+            if where is not None:
+                # The lexical index knows nothing of metadata: keep only hits that pass the filter
+                self._fetch([chunk_id for chunk_id in lexical if chunk_id not in found], found, where)
+                lexical = [chunk_id for chunk_id in lexical if chunk_id in found]
+            rankings.append(lexical)
+
+        top_ids = [chunk_id for chunk_id, _ in reciprocal_rank_fusion(rankings)[:self.k]]
+
+        # Chunks only found lexically still need their text and vector
+        self._fetch([chunk_id for chunk_id in top_ids if chunk_id not in found], found)
+
+        # A lexical hit whose chunk is gone from the vector store is skipped
+        hits = [found[chunk_id] for chunk_id in top_ids if chunk_id in found]
+        if len(rankings) > 1:
+            lexical_ranks = {chunk_id: rank for rank, chunk_id in enumerate(rankings[1], 1)}
+            for doc, _ in hits:
+                if doc.id in lexical_ranks:
+                    doc.metadata["lexical_rank"] = lexical_ranks[doc.id]
+        return [doc for doc, _ in hits], [vector for _, vector in hits]
+
+    def _fetch(self, ids, found, where=None):
+        """Add the text and vector of chunks (those matching `where`) to `found`"""
+        if not ids:
+            return
+        with trace("query.vector_search"):
+            batch = self.collection.get(ids=ids, where=where, include=["documents", "metadatas", "embeddings"])
+        for chunk_id, text, metadata, vector in zip(
+            batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"]
+        ):
+            found[chunk_id] = (Document(page_content=text, metadata=metadata or {}, id=chunk_id), vector)
+
+    def invoke(self, question, where=None):
+        return self.invoke_with_vectors(question, where=where)[0]
+
+def open_lexical_index(db_path):
+    """Open the lexical index in a folder for querying, or None if process_docs.py hasn't built one"""
+    if not os.path.exists(get_lexical_index_path(db_path)):
+        print("Warning: no lexical index found, hybrid search uses vector similarity only. "
+              "Run process_docs.py to build it.")
+        return None
+    return LexicalIndex(db_path)
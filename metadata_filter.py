@@ -0,0 +1,90 @@
+"""
+Metadata filters for scoped retrieval.
+
+Filters are `field<op>value` expressions (rag_query.py --where, "where" in the
+web API), e.g. "file_type=pdf", "mtime>=2024-01-01", "source~=/projects/pouches/".
+They become a Chroma `where` clause, so vector search only scans matching
+chunks. Fields are the chunk metadata written by process_docs.py.
+
+`source~=` matches file paths by substring, or as a glob when the pattern
+contains *, ? or [. Chroma can't match metadata by pattern, so it is resolved
+against the collection's manifest into an explicit list of sources.
+"""
+
+import fnmatch
+import os
+import re
+from datetime import datetime
+
+FILTER_FIELDS = ("source", "root", "file_type", "mtime", "page_number")
+NUMERIC_FIELDS = ("mtime", "page_number")
+
+_OPERATORS = {"=": "$eq", "!=": "$ne", ">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte", "~=": None}
+_FILTER_RE = re.compile(r"^\s*([a-z_]+)\s*(~=|!=|>=|<=|=|>|<)\s*(.+?)\s*$")
+
+def _parse_value(field, value):
+    if field == "mtime":
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                raise ValueError(f"mtime must be a timestamp or a date like 2024-01-31, not {value!r}")
+    if field == "page_number":
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"page_number must be a whole number, not {value!r}")
+    if field == "file_type":
+        return value.lower().lstrip(".")
+    if field == "root":
+        return os.path.join(value, "")
+    return value
+
+def parse_filter(expression):
+    """
+    Parse one filter expression
+    Returns: (field, operator, value), operator being "~=" or a Chroma operator such as "$gte"
+    """
+    match = _FILTER_RE.match(expression)
+    if not match:
+        raise ValueError(f"Invalid filter {expression!r}, expected field=value (or !=, >, >=, <, <=, ~=)")
+    field, operator, value = match.groups()
+    if field not in FILTER_FIELDS:
+        raise ValueError(f"Unknown filter field {field!r} (use one of: {', '.join(FILTER_FIELDS)})")
+    if operator == "~=" and field != "source":
+        raise ValueError("~= only applies to source")
+    if operator in (">", ">=", "<", "<=") and field not in NUMERIC_FIELDS:
+        raise ValueError(f"{operator} only applies to {' and '.join(NUMERIC_FIELDS)}")
+    return field, _OPERATORS[operator] or operator, _parse_value(field, value)
+
+def match_sources(pattern, paths):
+    """Paths containing `pattern`, or matching it as a glob"""
+    if any(char in pattern for char in "*?["):
+        return [path for path in paths if fnmatch.fnmatch(path, pattern)]
+    return [path for path in paths if pattern in path]
+
+def needs_manifest(expressions):
+    """True when resolving the filters needs the list of indexed files"""
+    return any(parse_filter(expression)[1] == "~=" for expression in expressions)
+
+def build_where(expressions, indexed_files=()):
+    """
+    Combine filter expressions into one Chroma `where` clause
+    `indexed_files` are the collection's file paths (only needed for source~=)
+    Returns: the clause, or None without filters
+    """
+    conditions = []
+    for expression in expressions:
+        field, operator, value = parse_filter(expression)
+        if operator == "~=":
+            sources = sorted(match_sources(value, indexed_files))
+            if not sources:
+                raise ValueError(f"No indexed file matches source~={value}")
+            conditions.append({"source": {"$in": sources}})
+        else:
+            conditions.append({field: {operator: value}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
@@ -0,0 +1,77 @@
+"""
+Named collections.
+
+Each collection in COLLECTIONS is indexed from its own folders into its own
+Chroma collection, with its manifest and lexical index in
+<VECTOR_DB_PATH>/collections/<name>/, so searching one collection never scans
+another's vectors.
+
+Indexes built before named collections used langchain's default collection
+with the manifest and lexical index at the top of VECTOR_DB_PATH;
+migrate_legacy_index() moves them into COLLECTION_NAME without re-embedding.
+"""
+
+import os
+import chromadb
+from langchain_chroma import Chroma
+from config import VECTOR_DB_PATH, COLLECTION_NAME
+from index_manifest import MANIFEST_FILENAME, get_manifest_path
+from lexical_index import LEXICAL_INDEX_FILENAME
+
+LEGACY_COLLECTION_NAME = "langchain"  # langchain_chroma's default collection
+
+def get_collection_dir(db_path, collection=COLLECTION_NAME):
+    """Folder holding a collection's manifest and lexical index"""
+    return os.path.join(db_path, "collections", collection)
+
+def list_collections(db_path=VECTOR_DB_PATH):
+    """Names of the collections that have been indexed"""
+    base = os.path.join(db_path, "collections")
+    if not os.path.isdir(base):
+        return []
+    return sorted(
+        name for name in os.listdir(base)
+        if os.path.exists(get_manifest_path(os.path.join(base, name)))
+    )
+
+def open_vectorstore(embeddings, collection=COLLECTION_NAME, db_path=VECTOR_DB_PATH):
+    """The Chroma vector store of a collection"""
+    return Chroma(
+        collection_name=collection,
+        persist_directory=db_path,
+        embedding_function=embeddings
+    )
+
+def has_legacy_index(db_path, collection=COLLECTION_NAME):
+    """True when an index from before named collections still needs migrating"""
+    return (os.path.exists(get_manifest_path(db_path))
+            and not os.path.exists(get_manifest_path(get_collection_dir(db_path, collection))))
+
+def migrate_legacy_index(db_path, collection=COLLECTION_NAME):
+    """
+    Move an index built before named collections into `collection`: the
+    Chroma collection is renamed and the manifest and lexical index are moved
+    into the collection's folder. Nothing is re-embedded.
+    Returns: True if an index was migrated
+    """
+    if not has_legacy_index(db_path, collection):
+        return False
+    client = chromadb.PersistentClient(path=db_path)
+    # Names (chromadb >= 0.6) or Collection objects (older versions)
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    if collection in names:
+        print(f"Warning: not migrating the old index, collection '{collection}' already exists.")
+        return False
+
+    print(f"Migrating the existing index into collection '{collection}'...")
+    if LEGACY_COLLECTION_NAME in names:
+        client.get_collection(LEGACY_COLLECTION_NAME).modify(name=collection)
+    target = get_collection_dir(db_path, collection)
+    os.makedirs(target, exist_ok=True)
+    for filename in (LEXICAL_INDEX_FILENAME, LEXICAL_INDEX_FILENAME + "-wal", LEXICAL_INDEX_FILENAME + "-shm",
+                     MANIFEST_FILENAME):
+        # The manifest goes last: its presence marks the migration as done
+        path = os.path.join(db_path, filename)
+        if os.path.exists(path):
+            os.replace(path, os.path.join(target, filename))
+    return True
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) Web RAG Server
+
+Serves the same interface as web_rag.py, but from a single event loop:
+- one shared query engine for all requests
+- concurrent identical questions are answered by a single computation
+- at most SERVER_MAX_CONCURRENT_QUERIES queries run against Ollama at once,
+  up to SERVER_MAX_QUEUED_QUERIES more wait in line, and anything beyond
+  that gets 503 so clients can retry instead of piling up
+- /query/stream sends sources, then tokens as they are generated
+- /health reports running, queued and coalesced queries
+- /metrics exposes per-stage latencies (including queue wait) for Prometheus
+
+Run with: python asgi_rag.py  (or: uvicorn asgi_rag:app --host 0.0.0.0 --port 5000)
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import time
+
+# Make both this folder (web_rag) and the project root (rag_query, config) importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import iterate_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from answer_cache import normalize_question
+from config import SERVER_MAX_CONCURRENT_QUERIES, SERVER_MAX_QUEUED_QUERIES
+from rag_query import get_default_engine, get_engine, format_timings
+from text_packing import format_context_report
+from tracing import increment, record, render_prometheus
+from web_rag import HTML_TEMPLATE, engine_status, format_answer, format_stream_event, get_local_ip, parse_scope
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class ServerOverloaded(Exception):
+    """Raised when the query queue is full"""
+
+class QueryCoordinator:
+    """
+    Runs queries on the shared engine with request coalescing and a bounded queue.
+
+    Identical in-flight questions (same mode, same text ignoring case and
+    whitespace) share one computation. Queries run in worker threads, at most
+    `max_concurrent` at a time; when `max_queued` more are already waiting,
+    new questions are rejected with ServerOverloaded.
+    """
+
+    def __init__(self, max_concurrent=SERVER_MAX_CONCURRENT_QUERIES, max_queued=SERVER_MAX_QUEUED_QUERIES):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._inflight = {}
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @staticmethod
+    def make_key(question, mode, collection=None, filters=()):
+        return mode, collection, tuple(filters), normalize_question(question)
+
+    async def submit(self, question, mode="qa", collection=None, filters=()):
+        key = self.make_key(question, mode, collection, filters)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            increment("queries_coalesced")
+        else:
+            if self.running + self.queued >= self.max_concurrent + self.max_queued:
+                self.rejected += 1
+                increment("queries_rejected")
+                raise ServerOverloaded()
+            # Counted as queued right away, so a burst in one loop tick can't over-admit
+            self.queued += 1
+            task = asyncio.ensure_future(self._run(question, mode, collection, filters))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        # A client disconnecting must not cancel a computation others are waiting on
+        return await asyncio.shield(task)
+
+    async def _run(self, question, mode, collection, filters):
+        started = False
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphore:
+                self.queued -= 1
+                started = True
+                record("server.queue_wait", time.perf_counter() - queued_at)
+                self.running += 1
+                try:
+                    engine = get_engine(collection)
+                    return await asyncio.to_thread(engine.query, question, True, mode, filters)
+                finally:
+                    self.running -= 1
+                    self.completed += 1
+        finally:
+            if not started:
+                self.queued -= 1
+
+    async def stream(self, question, mode="qa", collection=None, filters=()):
+        """
+        Yield the engine's stream events for a question. Streams are not
+        coalesced (each client consumes its own token stream), but they share
+        the same concurrency limit and queue as regular queries.
+        """
+        if self.running + self.queued >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            increment("queries_rejected")
+            raise ServerOverloaded()
+        self.queued += 1
+        started = False
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphore:
+                self.queued -= 1
+                started = True
+                record("server.queue_wait", time.perf_counter() - queued_at)
+                self.running += 1
+                try:
+                    engine = get_engine(collection)
+                    async for event in iterate_in_threadpool(engine.stream(question, mode, filters)):
+                        yield event
+                finally:
+                    self.running -= 1
+                    self.completed += 1
+        finally:
+            if not started:
+                self.queued -= 1
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'max_concurrent': self.max_concurrent,
+            'max_queued': self.max_queued,
+            'completed': self.completed,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+        }
+
+coordinator = QueryCoordinator()
+
+async def home(request):
+    """Serve the main web interface"""
+    html = HTML_TEMPLATE.replace('{{ host_ip }}', get_local_ip()).replace('{{ port }}', str(request.url.port or 5000))
+    return HTMLResponse(html)
+
+async def query(request):
+    """Handle document queries"""
+    if request.method == 'OPTIONS':
+        return Response()
+
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not data or 'question' not in data:
+        return JSONResponse({'error': 'No question provided'}, status_code=400)
+
+    question = data['question']
+    mode = data.get('mode', 'qa')
+    if mode not in ('qa', 'summary'):
+        return JSONResponse({'error': 'mode must be "qa" or "summary"'}, status_code=400)
+    try:
+        collection, filters = await asyncio.to_thread(parse_scope, data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    logger.info(f"Processing query: {question}")
+    try:
+        result = await coordinator.submit(question, mode, collection, filters)
+    except ServerOverloaded:
+        logger.warning("Query queue full, rejecting request")
+        return JSONResponse(
+            {'error': 'Server is busy, please retry in a few seconds'},
+            status_code=503,
+            headers={'Retry-After': '5'}
+        )
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}", exc_info=True)
+        return JSONResponse({'error': f"Server error: {str(e)}"}, status_code=500)
+
+    if 'context_report' in result:
+        logger.info(format_context_report(result['context_report']))
+        logger.info(format_timings(result['timings']))
+    logger.info("Query processed successfully")
+    return JSONResponse({'answer': format_answer(result)})
+
+async def query_stream(request):
+    """Stream an answer as newline-delimited JSON: sources, then tokens, then timings"""
+    if request.method == 'OPTIONS':
+        return Response()
+
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not data or 'question' not in data:
+        return JSONResponse({'error': 'No question provided'}, status_code=400)
+
+    question = data['question']
+    mode = data.get('mode', 'qa')
+    if mode not in ('qa', 'summary'):
+        return JSONResponse({'error': 'mode must be "qa" or "summary"'}, status_code=400)
+    try:
+        collection, filters = await asyncio.to_thread(parse_scope, data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    # Admit (or reject) before the response starts, so overload is still a plain 503
+    events = coordinator.stream(question, mode, collection, filters)
+    try:
+        first = await events.__anext__()
+    except ServerOverloaded:
+        logger.warning("Query queue full, rejecting request")
+        return JSONResponse(
+            {'error': 'Server is busy, please retry in a few seconds'},
+            status_code=503,
+            headers={'Retry-After': '5'}
+        )
+    except Exception as e:
+        logger.error(f"Error streaming query: {str(e)}", exc_info=True)
+        return JSONResponse({'error': f"Server error: {str(e)}"}, status_code=500)
+
+    logger.info(f"Streaming query: {question}")
+
+    async def body():
+        try:
+            yield format_stream_event(first)
+            async for event in events:
+                yield format_stream_event(event)
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}", exc_info=True)
+            yield format_stream_event({'type': 'error', 'error': f"Server error: {str(e)}"})
+        finally:
+            await events.aclose()
+
+    async def release():
+        # A plain coroutine function: Starlette would run the builtin events.aclose in a thread
+        await events.aclose()
+
+    # The stream already holds a query slot: release it after the response even if
+    # the body was never iterated (client gone before streaming started)
+    return StreamingResponse(body(), media_type='application/x-ndjson', background=BackgroundTask(release))
+
+async def health(request):
+    """Health check endpoint (includes queue depth)"""
+    status = {
+        'status': 'healthy',
+        'ip': get_local_ip(),
+        'cors_enabled': True,
+        'queries': coordinator.stats(),
+    }
+    status.update(await asyncio.to_thread(engine_status, get_default_engine))
+    return JSONResponse(status)
+
+async def metrics(request):
+    """Per-stage latency histograms and counters (Prometheus text format)"""
+    return PlainTextResponse(render_prometheus(), media_type='text/plain; version=0.0.4')
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Build the shared query engine once, so the first request doesn't pay for it
+    try:
+        await asyncio.to_thread(get_default_engine)
+        logger.info("Query engine initialized")
+    except Exception as e:
+        logger.warning(f"Could not initialize query engine at startup: {e}")
+    yield
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/query', query, methods=['POST', 'OPTIONS']),
+        Route('/query/stream', query_stream, methods=['POST', 'OPTIONS']),
+        Route('/health', health),
+        Route('/metrics', metrics),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['GET', 'POST', 'OPTIONS'], allow_headers=['Content-Type']),
+    ],
+    lifespan=lifespan,
+)
+
+def main():
+    """Main entry point"""
+    local_ip = get_local_ip()
+    port = int(os.environ.get('PORT', 5000))
+
+    print("\n" + "="*70)
+    print("🚀 LOCAL RAG SERVER STARTING (async)")
+    print("="*70)
+    print(f"📍 Local access:    http://localhost:{port}")
+    print(f"🌐 Network access:  http://{local_ip}:{port}")
+    print(f"⚙️  Concurrent queries: {SERVER_MAX_CONCURRENT_QUERIES} (+{SERVER_MAX_QUEUED_QUERIES} queued)")
+    print("="*70 + "\n")
+
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level='info')
+
+if __name__ == '__main__':
+    main()
@@ -20,8 +20,12 @@ if ! curl -s http://localhost:11434/api/tags > /dev/null 2>&1; then
     echo ""
 fi
 
-# Start the server
+# Start the server ("--async" runs the ASGI server with request coalescing and queueing)
 echo "Starting web server..."
 echo "Press Ctrl+C to stop"
 echo ""
-pixi run python web_rag.py
+if [ "$1" == "--async" ]; then
+    pixi run python asgi_rag.py
+else
+    pixi run python web_rag.py
+fi
@@ -5,9 +5,9 @@
 echo "Stopping Local RAG Server..."
 
 # Check if the server is running
-if pgrep -f "python.*web_rag" > /dev/null; then
+if pgrep -f "python.*(web|asgi)_rag" > /dev/null; then
     # Kill the process
-    pkill -f "python.*web_rag"
+    pkill -f "python.*(web|asgi)_rag"
     echo "✅ Server stopped successfully"
 else
     echo "ℹ️  Server is not running"
@@ -15,17 +15,17 @@ fi
 
 # Double-check
 sleep 1
-if pgrep -f "python.*web_rag" > /dev/null; then
+if pgrep -f "python.*(web|asgi)_rag" > /dev/null; then
     echo "⚠️  Server still running, forcing stop..."
-    pkill -9 -f "python.*web_rag"
+    pkill -9 -f "python.*(web|asgi)_rag"
     echo "✅ Server force stopped"
 fi
 
 # Show any remaining Python processes (for debugging)
-remaining=$(ps aux | grep -E "python.*web_rag" | grep -v grep | wc -l)
+remaining=$(ps aux | grep -E "python.*(web|asgi)_rag" | grep -v grep | wc -l)
 if [ "$remaining" -gt 0 ]; then
     echo "⚠️  Warning: Some processes may still be running:"
-    ps aux | grep -E "python.*web_rag" | grep -v grep
+    ps aux | grep -E "python.*(web|asgi)_rag" | grep -v grep
 else
     echo "✅ All web_rag processes stopped"
 fi
@@ -3,7 +3,8 @@
 Fixed Web RAG Server - Accessible from network
 """
 
-from flask import Flask, request, jsonify, render_template_string, make_response
+from flask import Flask, Response, request, jsonify, render_template_string, make_response, stream_with_context
+import json
 import socket
 import logging
 import sys
@@ -11,6 +12,9 @@ import os
 
 # Add the current directory to path to ensure imports work
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import render_prometheus
 
 # Try to import flask_cors, but work without it if not available
 try:
@@ -29,12 +33,15 @@ logger = logging.getLogger(__name__)
 
 # Import the query function
 try:
-    from rag_query import query_rag
+    from rag_query import query_rag, get_default_engine, get_engine, format_timings
+    from text_packing import format_context_report
 except ImportError as e:
     logger.error(f"Failed to import rag_query: {e}")
     # Create a dummy function for testing
-    def query_rag(question):
+    def query_rag(question, return_sources=True, mode="qa", collection=None, filters=()):
         return {"result": f"Test response for: {question}. (Note: rag_query module not loaded)", "source_documents": []}
+    get_default_engine = None
+    get_engine = None
 
 app = Flask(__name__)
 
@@ -217,6 +224,9 @@ HTML_TEMPLATE = """
     </div>
     
     <script>
+        const escapeHtml = (text) => text
+            .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+        
         document.getElementById('queryForm').onsubmit = async (e) => {
             e.preventDefault();
             const question = document.getElementById('question').value.trim();
@@ -235,7 +245,9 @@ HTML_TEMPLATE = """
             answerDiv.innerHTML = '<div class="loading">Searching through your documents...</div>';
             
             try {
-                const response = await fetch('/query', {
+                // Answer is streamed as newline-delimited JSON events:
+                // sources first, then tokens, then a timing summary
+                const response = await fetch('/query/stream', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
                     body: JSON.stringify({question})
@@ -245,20 +257,50 @@ HTML_TEMPLATE = """
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
                 
-                const data = await response.json();
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let answer = '';
+                let sources = [];
+                let trailer = '';
                 
-                if (data.error) {
-                    answerDiv.innerHTML = 
-                        `<div class="error">❌ Error: ${data.error}</div>`;
-                } else {
-                    const formattedAnswer = data.answer
-                        .replace(/\n\n/g, '</p><p>')
-                        .replace(/\n/g, '<br>');
+                const render = () => {
+                    const formattedAnswer = escapeHtml(answer)
+                        .replace(/\\n\\n/g, '</p><p>')
+                        .replace(/\\n/g, '<br>');
+                    const sourceList = sources.slice(0, 3)
+                        .map((s, i) => `${i + 1}. ${escapeHtml(s.source)}`).join('<br>');
                     answerDiv.innerHTML = 
                         `<div class="success">
                             <h3>📄 Answer:</h3>
-                            <p>${formattedAnswer}</p>
+                            <p>${formattedAnswer || 'Generating answer...'}</p>
+                            ${sourceList ? `<p><strong>Sources:</strong><br>${sourceList}</p>` : ''}
+                            ${trailer ? `<p><small>${trailer}</small></p>` : ''}
                         </div>`;
+                };
+                
+                while (true) {
+                    const {value, done} = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, {stream: true});
+                    const lines = buffer.split('\\n');
+                    buffer = lines.pop();
+                    for (const line of lines) {
+                        if (!line.trim()) continue;
+                        const event = JSON.parse(line);
+                        if (event.type === 'error') {
+                            throw new Error(event.error);
+                        } else if (event.type === 'sources') {
+                            sources = event.sources;
+                        } else if (event.type === 'token') {
+                            answer += event.text;
+                        } else if (event.type === 'done') {
+                            trailer = `First token after ${event.time_to_first_token}s, ` +
+                                `${event.tokens} tokens in ${event.total_time}s` +
+                                (event.tokens_per_second ? ` (${event.tokens_per_second} tokens/sec)` : '');
+                        }
+                    }
+                    render();
                 }
             } catch (error) {
                 answerDiv.innerHTML = 
@@ -296,6 +338,46 @@ def get_local_ip():
         except:
             return "localhost"
 
+def format_answer(result):
+    """Turn a query_rag() result into the answer text shown in the web interface"""
+    # Extract the answer from the result
+    if isinstance(result, dict) and 'result' in result:
+        answer = result['result']
+        sources = result.get('source_documents', [])
+        # Format sources if available
+        if sources:
+            source_info = "\n\nSources:\n"
+            for i, doc in enumerate(sources[:3], 1):  # Limit to 3 sources
+                source = doc.metadata.get('source', 'Unknown')
+                source_info += f"{i}. {source}\n"
+            answer += source_info
+    else:
+        answer = str(result) if result else "I couldn't find relevant information in the documents to answer your question."
+    
+    if not answer or answer == "None":
+        answer = "I couldn't find relevant information in the documents to answer your question. Please make sure documents have been processed."
+    return answer
+
+def format_stream_event(event):
+    """One newline-delimited JSON line of a streamed answer"""
+    return json.dumps(event) + "\n"
+
+def parse_scope(data):
+    """
+    Collection ("collection") and metadata filters ("where": one filter
+    expression or a list, e.g. ["file_type=pdf", "source~=/projects/pouches/"])
+    of a request. Raises ValueError for an unknown collection or invalid filter.
+    """
+    collection = data.get('collection') or None
+    filters = data.get('where') or []
+    if isinstance(filters, str):
+        filters = [filters]
+    if not isinstance(filters, list) or not all(isinstance(f, str) for f in filters):
+        raise ValueError('where must be a filter expression or a list of them')
+    if get_engine is not None:
+        get_engine(collection).resolve_filters(filters)
+    return collection, filters
+
 @app.route('/')
 def home():
     """Serve the main web interface"""
@@ -319,28 +401,22 @@ def query():
             return jsonify({'error': 'No question provided'}), 400
         
         question = data['question']
+        mode = data.get('mode', 'qa')
+        if mode not in ('qa', 'summary'):
+            return jsonify({'error': 'mode must be "qa" or "summary"'}), 400
+        try:
+            collection, filters = parse_scope(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         logger.info(f"Processing query: {question}")
         
         # Call the RAG query function
-        result = query_rag(question)
-        
-        # Extract the answer from the result
-        if isinstance(result, dict) and 'result' in result:
-            answer = result['result']
-            sources = result.get('source_documents', [])
-            # Format sources if available
-            if sources:
-                source_info = "\n\nSources:\n"
-                for i, doc in enumerate(sources[:3], 1):  # Limit to 3 sources
-                    source = doc.metadata.get('source', 'Unknown')
-                    source_info += f"{i}. {source}\n"
-                answer += source_info
-        else:
-            answer = str(result) if result else "I couldn't find relevant information in the documents to answer your question."
-        
-        if not answer or answer == "None":
-            answer = "I couldn't find relevant information in the documents to answer your question. Please make sure documents have been processed."
+        result = query_rag(question, mode=mode, collection=collection, filters=filters)
+        answer = format_answer(result)
         
+        if isinstance(result, dict) and 'context_report' in result:
+            logger.info(format_context_report(result['context_report']))
+            logger.info(format_timings(result['timings']))
         logger.info(f"Query processed successfully")
         return jsonify({'answer': answer})
         
@@ -348,14 +424,69 @@ def query():
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         return jsonify({'error': f"Server error: {str(e)}"}), 500
 
+@app.route('/query/stream', methods=['POST', 'OPTIONS'])
+def query_stream():
+    """Stream an answer as newline-delimited JSON: sources, then tokens, then timings"""
+    if request.method == 'OPTIONS':
+        response = make_response()
+        if not HAS_CORS:
+            response = add_cors_headers(response)
+        return response
+    
+    data = request.json
+    if not data or 'question' not in data:
+        return jsonify({'error': 'No question provided'}), 400
+    if get_default_engine is None:
+        return jsonify({'error': 'Query engine is not available'}), 500
+    
+    question = data['question']
+    mode = data.get('mode', 'qa')
+    if mode not in ('qa', 'summary'):
+        return jsonify({'error': 'mode must be "qa" or "summary"'}), 400
+    try:
+        collection, filters = parse_scope(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    logger.info(f"Streaming query: {question}")
+    
+    def generate():
+        try:
+            for event in get_engine(collection).stream(question, mode=mode, filters=filters):
+                yield format_stream_event(event)
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}", exc_info=True)
+            yield format_stream_event({'type': 'error', 'error': f"Server error: {str(e)}"})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def engine_status(get_engine_func):
+    """Query engine part of /health: its cache stats, or why it isn't available"""
+    try:
+        engine = get_engine_func()
+    except Exception as e:
+        # Ollama down or no database: the server is up, but can't answer yet
+        logger.warning(f"Query engine unavailable: {e}")
+        return {'status': 'degraded', 'engine': 'unavailable', 'engine_error': str(e)}
+    return {'engine': 'ready', **engine.cache_stats()}
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
+    status = {
         'status': 'healthy',
         'ip': get_local_ip(),
         'cors_enabled': HAS_CORS
-    })
+    }
+    if get_default_engine is None:
+        status.update({'status': 'degraded', 'engine': 'not loaded'})
+    else:
+        status.update(engine_status(get_default_engine))
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    """Per-stage latency histograms and counters (Prometheus text format)"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 def main():
     """Main entry point"""
@@ -373,6 +504,14 @@ def main():
     print("💡 Tip: Share the network URL with other devices on your network")
     print("="*70 + "\n")
     
+    # Build the shared query engine once, so the first request doesn't pay for it
+    if get_default_engine is not None:
+        try:
+            get_default_engine()
+            logger.info("Query engine initialized")
+        except Exception as e:
+            logger.warning(f"Could not initialize query engine at startup: {e}")
+    
     # Run the Flask app
     try:
         app.run(
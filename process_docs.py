@@ -1,64 +1,447 @@
+import multiprocessing
 import os
+import queue
+import threading
+import time
+import argparse
 import chromadb
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, UnstructuredFileLoader
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from config import DOCUMENT_PATHS, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, VECTOR_DB_PATH, COLLECTION_NAME
-
-def process_documents(docs_directories, db_path):
-    documents = []
-
-    for docs_directory in docs_directories:
-        print(f"Loading documents from {docs_directory}...")
-
-        # Use a single DirectoryLoader with UnstructuredFileLoader for all document types
-        loader = DirectoryLoader(
-            docs_directory,
-            glob="**/*",
-            loader_cls=UnstructuredFileLoader,
-            silent_errors=True
+from langchain_community.document_loaders import UnstructuredFileLoader
+from langchain_community.vectorstores.utils import filter_complex_metadata
+from config import (
+    COLLECTIONS, CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_DB_PATH, COLLECTION_NAME,
+    EMBED_BATCH_SIZE, EMBED_CONCURRENCY, WRITE_BATCH_SIZE, LOAD_JOBS
+)
+from embedding_cache import get_embeddings
+from file_discovery import discover_files, new_discovery_stats, format_discovery_stats, get_age_cutoff
+from index_manifest import MANIFEST_FORMAT, load_manifest, save_manifest, file_signature, hash_file, make_chunk_ids
+from lexical_index import LexicalIndex
+from namespaces import get_collection_dir, open_vectorstore, migrate_legacy_index
+from tracing import trace, record, increment, format_profile
+
+def load_file(path):
+    """
+    Parse one file with unstructured (runs in a worker process), one document
+    per page for paged formats such as PDF
+    Returns: (documents, seconds, error message or None)
+    """
+    start = time.time()
+    try:
+        documents = UnstructuredFileLoader(path, mode="paged").load()
+        for document in documents:
+            # Keep the page number, drop the per-element details unstructured adds
+            page_number = document.metadata.get("page_number")
+            document.metadata = {"source": path}
+            if page_number is not None:
+                document.metadata["page_number"] = page_number
+        return documents, time.time() - start, None
+    except Exception as e:
+        return [], time.time() - start, f"{type(e).__name__}: {e}"
+
+def file_metadata(path, entry):
+    """Metadata stored on every chunk of a file (besides source and page_number), used by --where filters"""
+    return {
+        "root": entry.get("root", ""),
+        "file_type": os.path.splitext(path)[1].lower().lstrip("."),
+        "mtime": entry["mtime"],
+    }
+
+def update_chunk_metadata(collection, path, entry):
+    """Rewrite the file-level metadata of a file's stored chunks"""
+    if not entry.get("chunk_ids"):
+        return
+    current = collection.get(ids=entry["chunk_ids"], include=["metadatas"])
+    if current["ids"]:
+        metadata = file_metadata(path, entry)
+        collection.update(
+            ids=current["ids"],
+            metadatas=[dict(existing or {}, **metadata) for existing in current["metadatas"]]
         )
-        loaded_docs = loader.load()
-        documents.extend(loaded_docs)
 
-    print(f"Total documents found: {len(documents)}")
+def delete_file_chunks(vectorstore, lexical_index, path, entry):
+    """Remove a file's chunks from the vector store and the lexical index"""
+    if entry and entry.get("chunk_ids"):
+        vectorstore.delete(ids=entry["chunk_ids"])
+    # Also catch chunks the manifest doesn't know about: a full (pre-manifest)
+    # build, or a file whose indexing failed halfway through
+    vectorstore._collection.delete(where={"source": path})
+    lexical_index.delete_source(path)
 
-    if not documents:
-        print("Error: No documents were found in the specified directories. Please check your paths and file types.")
-        return None
+class EmbeddingPipeline:
+    """
+    Embeds chunks in fixed-size batches with several concurrent requests to
+    Ollama, while a separate writer thread upserts finished vectors into Chroma
+    in large batches. Loading/splitting (the caller), embedding and writing
+    therefore overlap instead of running one after another.
+
+    `on_file_done(path, error)` is called from the writer thread once every
+    chunk of a file is stored (or as soon as one of its batches failed).
+    """
+
+    def __init__(self, vectorstore, embeddings, on_file_done,
+                 batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY, write_batch_size=WRITE_BATCH_SIZE):
+        self.collection = vectorstore._collection
+        self.embeddings = embeddings
+        self.on_file_done = on_file_done
+        self.batch_size = max(1, batch_size)
+
+        # Chroma rejects upserts above the client's max batch size
+        get_max_batch_size = getattr(vectorstore._client, "get_max_batch_size", None)
+        self.write_batch_size = min(write_batch_size, get_max_batch_size()) if get_max_batch_size else write_batch_size
+
+        self._files = {}
+        self._files_lock = threading.Lock()
+        # Bound the work queued ahead of the embedder so memory stays flat
+        self._slots = threading.BoundedSemaphore(max(1, concurrency) * 2)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._start_time = time.time()
+        self.queued = 0
+        self.written = 0
+        self._writer.start()
+
+    def add_file(self, path, ids, splits):
+        """Queue all chunks of one file for embedding and storage"""
+        texts = [doc.page_content for doc in splits]
+        metadatas = [doc.metadata for doc in splits]
+        with self._files_lock:
+            self._files[path] = {"remaining": len(ids), "error": None}
+            self.queued += len(ids)
 
-    # Split documents into chunks
-    print("Splitting documents into chunks...")
+        for i in range(0, len(ids), self.batch_size):
+            self._slots.acquire()
+            self._executor.submit(
+                self._embed_batch, path,
+                ids[i:i + self.batch_size], texts[i:i + self.batch_size], metadatas[i:i + self.batch_size]
+            )
+
+    def _embed_batch(self, path, ids, texts, metadatas):
+        try:
+            with trace("index.embed_batch"):
+                vectors = self.embeddings.embed_documents(texts)
+            increment("chunks_embedded", len(texts))
+            self._write_queue.put((path, ids, vectors, texts, metadatas, None))
+        except Exception as e:
+            self._write_queue.put((path, ids, None, None, None, e))
+        finally:
+            self._slots.release()
+
+    def _write_loop(self):
+        buffer = []
+        buffered = 0
+        while True:
+            try:
+                item = self._write_queue.get(timeout=0.5)
+            except queue.Empty:
+                item = False  # Idle: flush what we have so progress stays visible
+            if item is None:
+                self._flush(buffer)
+                return
+            if item:
+                path, ids, vectors, texts, metadatas, error = item
+                if error is not None:
+                    self._mark_done(path, len(ids), error)
+                    continue
+                buffer.append(item)
+                buffered += len(ids)
+            if buffer and (buffered >= self.write_batch_size or item is False):
+                self._flush(buffer)
+                buffer = []
+                buffered = 0
+
+    def _flush(self, buffer):
+        if not buffer:
+            return
+        try:
+            with trace("index.vector_write"):
+                self.collection.upsert(
+                    ids=[i for item in buffer for i in item[1]],
+                    embeddings=[v for item in buffer for v in item[2]],
+                    documents=[t for item in buffer for t in item[3]],
+                    metadatas=[m for item in buffer for m in item[4]],
+                )
+            error = None
+        except Exception as e:
+            error = e
+
+        for path, ids, *_ in buffer:
+            if error is None:
+                self.written += len(ids)
+            self._mark_done(path, len(ids), error)
+
+        elapsed = time.time() - self._start_time
+        rate = self.written / elapsed if elapsed > 0 else 0.0
+        print(f"\r  Embedded {self.written}/{self.queued} chunks | {rate:.1f} chunks/sec", end="", flush=True)
+
+    def _mark_done(self, path, count, error):
+        with self._files_lock:
+            state = self._files[path]
+            state["remaining"] -= count
+            if error is not None and state["error"] is None:
+                state["error"] = error
+                # Report the failure once, right away
+                self.on_file_done(path, error)
+            if state["remaining"] == 0:
+                del self._files[path]
+                if state["error"] is None:
+                    self.on_file_done(path, None)
+
+    def close(self):
+        """Wait for all queued chunks to be embedded and written"""
+        self._executor.shutdown(wait=True)
+        self._write_queue.put(None)
+        self._writer.join()
+        if self.queued:
+            print()
+
+def process_documents(docs_directories, db_path, embed_batch_size=EMBED_BATCH_SIZE, embed_concurrency=EMBED_CONCURRENCY,
+                      jobs=LOAD_JOBS, collection=COLLECTION_NAME):
+    """
+    Incrementally index documents into a collection's vector store and lexical (BM25) index.
+
+    Only new or changed files are loaded, split and embedded; chunks of removed
+    files are deleted and untouched files are skipped. Re-running without any
+    file changes is a no-op. Files are parsed by `jobs` worker processes and
+    streamed into splitting/embedding as each one finishes; embedding runs
+    `embed_concurrency` requests of `embed_batch_size` chunks at a time,
+    overlapped with parsing and writing.
+    """
+    if collection == COLLECTION_NAME:
+        migrate_legacy_index(db_path, collection)
+    index_dir = get_collection_dir(db_path, collection)
+    manifest = load_manifest(index_dir)
+    indexed_files = manifest["files"]
+    stats = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "failed": 0}
+    # The writer thread records finished files while this thread keeps scanning
+    manifest_lock = threading.Lock()
+    pending_entries = {}
+    last_save = time.time()
+
+    embeddings = get_embeddings()
+    vectorstore = open_vectorstore(embeddings, collection, db_path)
+    lexical_index = LexicalIndex(index_dir)
+    if indexed_files and not len(lexical_index):
+        print("Building lexical index from the existing vector store...")
+        print(f"  {lexical_index.rebuild_from(vectorstore._collection)} chunks indexed")
+    if manifest["format"] < MANIFEST_FORMAT:
+        # Indexed before chunks carried root/file type/mtime (page numbers come with re-indexing)
+        print(f"Adding file metadata to the chunks of {len(indexed_files)} indexed files...")
+        for path, entry in indexed_files.items():
+            entry["root"] = next(
+                (os.path.join(d, "") for d in docs_directories if path.startswith(os.path.join(d, ""))), ""
+            )
+            update_chunk_metadata(vectorstore._collection, path, entry)
+        manifest["format"] = MANIFEST_FORMAT
+        save_manifest(index_dir, manifest)
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
+        chunk_overlap=CHUNK_OVERLAP,
+        add_start_index=True  # Lets extraction restore document order and trim overlaps
     )
-    splits = text_splitter.split_documents(documents)
-    print(f"Split documents into {len(splits)} chunks.")
 
-    if not splits:
-        print("Error: No chunks were created. This may be due to empty documents.")
-        return None
+    def on_file_done(path, error):
+        nonlocal last_save
+        with manifest_lock:
+            kind, entry = pending_entries.pop(path)
+            if error is not None:
+                print(f"\n    Failed to index {path}: {error}")
+                stats["failed"] += 1
+                return
+            # Only now is the file fully stored: record it in the manifest
+            indexed_files[path] = entry
+            stats[kind] += 1
+            manifest["index_version"] += 1
+            if time.time() - last_save > 5:
+                save_manifest(index_dir, manifest)
+                last_save = time.time()
 
-    # Create embeddings
-    print(f"Creating embeddings using model '{EMBEDDING_MODEL}' and building vector store...")
-    embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
+    pipeline = EmbeddingPipeline(
+        vectorstore, embeddings, on_file_done,
+        batch_size=embed_batch_size, concurrency=embed_concurrency
+    )
 
-    # Create vector store
-    vectorstore = Chroma.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        persist_directory=db_path
+    seen_files = set()
+    scanned_roots = []
+    discovery_stats = new_discovery_stats()
+    parse_times = {}
+    parse_failures = {}
+    # Parsing runs in worker processes; results are split and embedded as they arrive.
+    # Workers are spawned, not forked: the pool starts them lazily, after the embedding
+    # threads and SQLite connections exist, and forking those can deadlock
+    load_pool = ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+    ) if jobs > 1 else None
+    loading = {}
+
+    def index_loaded(path, entry, new_entry, documents, seconds, error):
+        parse_times[path] = seconds
+        record("index.parse", seconds)
+        if error is not None:
+            print(f"\n    Failed to parse {path} ({seconds:.1f}s): {error}")
+            parse_failures[path] = error
+            stats["failed"] += 1
+            return
+        print(f"\n  {'Updated' if entry else 'Added'}: {path} (parsed in {seconds:.1f}s)")
+
+        with trace("index.split"):
+            splits = filter_complex_metadata(text_splitter.split_documents(documents))
+        metadata = file_metadata(path, new_entry)
+        for split in splits:
+            split.metadata.update(metadata)
+        chunk_ids = make_chunk_ids(path, new_entry["sha256"], len(splits))
+        new_entry["chunk_ids"] = chunk_ids
+        new_entry["parse_seconds"] = round(seconds, 3)
+
+        with trace("index.delete_old_chunks"):
+            delete_file_chunks(vectorstore, lexical_index, path, entry)
+        with trace("index.lexical_index"):
+            lexical_index.add_chunks(chunk_ids, [split.page_content for split in splits], [path] * len(splits))
+        with manifest_lock:
+            pending_entries[path] = ("updated" if entry else "added", new_entry)
+        if splits:
+            pipeline.add_file(path, chunk_ids, splits)
+        else:
+            on_file_done(path, None)
+
+    def collect_loaded(block=True):
+        # Blocking: at least one parse finished; otherwise only what is done already
+        done, _ = wait(loading, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, entry, new_entry = loading.pop(future)
+            try:
+                documents, seconds, error = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. a parser crash)
+                documents, seconds, error = [], 0.0, f"{type(e).__name__}: {e}"
+            index_loaded(path, entry, new_entry, documents, seconds, error)
+
+    try:
+        for docs_directory in docs_directories:
+            if not os.path.isdir(docs_directory):
+                # Leave its files in the index: an unmounted share is not a deletion
+                print(f"Warning: {docs_directory} is not available, skipping.")
+                continue
+
+            print(f"Scanning documents in {docs_directory}...")
+            scanned_roots.append(os.path.join(docs_directory, ""))
+
+            for path, stat in discover_files(docs_directory, stats=discovery_stats):
+                seen_files.add(path)
+                entry = indexed_files.get(path)
+                size, mtime = file_signature(stat)
+
+                if entry and entry["size"] == size and entry["mtime"] == mtime:
+                    stats["skipped"] += 1
+                    continue
+
+                with trace("index.hash_file"):
+                    content_hash = hash_file(path)
+                if entry and entry["sha256"] == content_hash:
+                    # Touched but not modified: refresh the signature only
+                    with manifest_lock:
+                        entry["size"], entry["mtime"] = size, mtime
+                        stats["skipped"] += 1
+                    update_chunk_metadata(vectorstore._collection, path, entry)
+                    continue
+
+                new_entry = {"size": size, "mtime": mtime, "sha256": content_hash, "root": scanned_roots[-1]}
+                if load_pool is None:
+                    index_loaded(path, entry, new_entry, *load_file(path))
+                    continue
+
+                # Hand files parsed so far to the embedding pipeline, without waiting
+                collect_loaded(block=False)
+                # Keep a few files queued per worker, no more (parsed documents can be large)
+                while len(loading) >= jobs * 2:
+                    collect_loaded()
+                loading[load_pool.submit(load_file, path)] = (path, entry, new_entry)
+
+        while loading:
+            collect_loaded()
+    finally:
+        if load_pool is not None:
+            load_pool.shutdown(cancel_futures=True)
+        pipeline.close()
+        manifest["parse_failures"] = parse_failures
+        save_manifest(index_dir, manifest)
+
+    print(format_discovery_stats(discovery_stats))
+    record("index.discovery", discovery_stats["seconds"])
+
+    # Files that disappeared from a scanned folder, now match an exclude pattern,
+    # or whose folder was removed from the config
+    age_cutoff = get_age_cutoff()
+    for path in list(indexed_files):
+        if path in seen_files:
+            continue
+        # MAX_FILE_AGE_DAYS limits what gets (re)processed; it doesn't drop old files from the index
+        entry = indexed_files[path]
+        if age_cutoff is not None and entry["mtime"] < age_cutoff and os.path.exists(path):
+            continue
+        under_scanned_root = any(path.startswith(root) for root in scanned_roots)
+        under_configured_root = any(path.startswith(os.path.join(d, "")) for d in docs_directories)
+        if under_scanned_root or not under_configured_root:
+            print(f"  Removing: {path}")
+            delete_file_chunks(vectorstore, lexical_index, path, indexed_files.pop(path))
+            stats["deleted"] += 1
+            manifest["index_version"] += 1
+
+    save_manifest(index_dir, manifest)
+
+    print(
+        f"Indexing complete: {stats['added']} added, {stats['updated']} updated, "
+        f"{stats['deleted']} deleted, {stats['skipped']} unchanged, {stats['failed']} failed "
+        f"({pipeline.written} chunks embedded)."
     )
+    if parse_times:
+        slowest = sorted(parse_times.items(), key=lambda item: item[1], reverse=True)[:5]
+        print(f"Parsing: {len(parse_times)} files in {sum(parse_times.values()):.1f}s of worker time. Slowest:")
+        for path, seconds in slowest:
+            print(f"  {seconds:7.1f}s  {path}")
+    if parse_failures:
+        print(f"{len(parse_failures)} files could not be parsed (listed under parse_failures in the manifest):")
+        for path, error in parse_failures.items():
+            print(f"  {path}: {error}")
+    if hasattr(embeddings, "stats"):
+        cache = embeddings.stats()
+        print(f"Embedding cache: {cache['hits']} hits, {cache['misses']} misses ({cache['entries']} entries)")
+
+    if not indexed_files:
+        print("Error: No documents were found in the specified directories. Please check your paths and file types.")
+        return None
 
-    print(f"Successfully processed {len(documents)} documents into {len(splits)} chunks.")
     return vectorstore
 
 if __name__ == "__main__":
-    try:
-        vectorstore = process_documents(DOCUMENT_PATHS, VECTOR_DB_PATH)
-        if vectorstore:
-            print("Successfully created vector store.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    parser = argparse.ArgumentParser(description='Incrementally index documents into the vector store')
+    parser.add_argument('--embed-batch-size', type=int, default=EMBED_BATCH_SIZE,
+                       help=f'Chunks per embedding request (default: {EMBED_BATCH_SIZE})')
+    parser.add_argument('--embed-concurrency', type=int, default=EMBED_CONCURRENCY,
+                       help=f'Concurrent embedding requests to Ollama (default: {EMBED_CONCURRENCY})')
+    parser.add_argument('--jobs', '-j', type=int, default=LOAD_JOBS,
+                       help=f'Worker processes for parsing documents (default: {LOAD_JOBS})')
+    parser.add_argument('--collection', choices=sorted(COLLECTIONS),
+                       help='Only index this collection (default: every collection in COLLECTIONS)')
+    parser.add_argument('--profile', action='store_true',
+                       help='Print time spent per stage (parsing, embedding, writes, ...) at the end')
+    args = parser.parse_args()
+
+    for name in ([args.collection] if args.collection else COLLECTIONS):
+        if len(COLLECTIONS) > 1:
+            print(f"\n=== Collection: {name} ===")
+        try:
+            vectorstore = process_documents(
+                COLLECTIONS[name], VECTOR_DB_PATH,
+                embed_batch_size=args.embed_batch_size,
+                embed_concurrency=args.embed_concurrency,
+                jobs=args.jobs,
+                collection=name
+            )
+            if vectorstore:
+                print("Vector store is up to date.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+    if args.profile:
+        print("\n" + format_profile())
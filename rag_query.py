@@ -1,13 +1,27 @@
+import os
 import sys
+import json
 import argparse
-from langchain_ollama import OllamaEmbeddings, OllamaLLM
-from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 from config import (
-    EMBEDDING_MODEL, VECTOR_DB_PATH, LLM_MODEL, 
-    get_mode_config, DEFAULT_MODE
+    EMBEDDING_MODEL, VECTOR_DB_PATH, COLLECTION_NAME, LLM_MODEL, ANSWER_CACHE_ENABLED,
+    SIMILARITY_SCORE_THRESHOLD, MAX_CONTEXT_LENGTH, CHARS_PER_TOKEN, EMBED_BATCH_SIZE,
+    BATCH_QUERY_CONCURRENCY, get_mode_config, DEFAULT_MODE
 )
+from embedding_cache import get_embeddings
+from answer_cache import AnswerCache
+from index_manifest import load_manifest
+from namespaces import get_collection_dir, list_collections, open_vectorstore, has_legacy_index
+from metadata_filter import build_where, needs_manifest
+from lexical_index import HybridRetriever, open_lexical_index
+from vector_ops import MMRRetriever, cosine_similarities
+from reranker import get_reranker
+from tracing import trace, record, increment, format_profile
+from text_packing import pack_context, pack_windows, format_context_report
 
 # Try to import the SHOW_SOURCES setting from config, default to True if not present
 try:
@@ -15,7 +29,413 @@ try:
 except ImportError:
     SHOW_SOURCES = True
 
-def query_rag(question, return_sources=True, mode="qa"):
+class RagEngine:
+    """
+    Long-lived query engine.
+
+    Owns the embedding client, the vector store handle of one collection and,
+    per mode, the retriever, prompt and LLM, built once and reused across
+    questions. Safe to share between threads (e.g. the Flask server's request
+    handlers).
+    """
+
+    def __init__(self, db_path=VECTOR_DB_PATH, embedding_model=EMBEDDING_MODEL, llm_model=LLM_MODEL,
+                 collection=COLLECTION_NAME):
+        self.db_path = db_path
+        self.collection = collection
+        # The collection's manifest and lexical index
+        self.index_dir = get_collection_dir(db_path, collection)
+        self.llm_model = llm_model
+        if has_legacy_index(db_path, collection):
+            print("Warning: the index was built before named collections. "
+                  "Run process_docs.py once to move it into collection '" + collection + "'.")
+        self.embeddings = get_embeddings(embedding_model)
+        self.vectorstore = open_vectorstore(self.embeddings, collection, db_path)
+        self.answer_cache = AnswerCache(self.index_dir) if ANSWER_CACHE_ENABLED else None
+        self._lexical_index = False  # Not opened yet
+        self._reranker = False  # Not loaded yet
+        self._pipelines = {}
+        self._lock = threading.Lock()
+
+    def get_lexical_index(self):
+        """The BM25 index built by process_docs.py (opened once, on first hybrid query)"""
+        if self._lexical_index is False:
+            self._lexical_index = open_lexical_index(self.index_dir)
+        return self._lexical_index
+
+    def cache_stats(self):
+        """Hit/miss statistics of the embedding cache, answer cache and reranker (those in use)"""
+        stats = {}
+        if hasattr(self.embeddings, "stats"):
+            stats["embedding_cache"] = self.embeddings.stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.stats()
+        if self._reranker:
+            stats["reranker"] = self._reranker.stats()
+        return stats
+
+    def get_reranker(self):
+        """The cross-encoder reranker, shared by all modes (None if unavailable)"""
+        if self._reranker is False:
+            self._reranker = get_reranker()
+        return self._reranker
+
+    def _build_pipeline(self, mode):
+        """Build the retriever, prompt and LLM for a mode"""
+        config = get_mode_config(mode)
+
+        # Initialize the LLM with mode-specific temperature
+        llm = OllamaLLM(model=self.llm_model, temperature=config["TEMPERATURE"])
+
+        # With reranking, every RETRIEVAL_FETCH_K candidate goes to the reranker
+        reranker = self.get_reranker() if config.get("RERANK") else None
+        k = config["RETRIEVAL_FETCH_K"] if reranker is not None else config["RETRIEVAL_K"]
+
+        # Create a retriever with mode-specific parameters
+        if config["RETRIEVAL_SEARCH_TYPE"] == "hybrid":
+            retriever = HybridRetriever(
+                self.vectorstore, self.embeddings, self.get_lexical_index(),
+                k=k, fetch_k=config["RETRIEVAL_FETCH_K"]
+            )
+        elif config["RETRIEVAL_SEARCH_TYPE"] == "mmr":
+            # MMR over the vectors stored in Chroma, vectorised in NumPy
+            retriever = MMRRetriever(
+                self.vectorstore, self.embeddings, k=k,
+                fetch_k=config["RETRIEVAL_FETCH_K"], lambda_mult=config["RETRIEVAL_LAMBDA_MULT"]
+            )
+        else:
+            retriever = self.vectorstore.as_retriever(
+                search_type=config["RETRIEVAL_SEARCH_TYPE"],
+                search_kwargs={"k": k}
+            )
+
+        # Use mode-specific prompt template
+        prompt = PromptTemplate(
+            input_variables=["context", "question"],
+            template=config["PROMPT_TEMPLATE"],
+        )
+
+        pipeline = {"config": config, "llm": llm, "retriever": retriever, "reranker": reranker, "prompt": prompt}
+        if config.get("GENERATION_STRATEGY") == "map_reduce":
+            pipeline["map_prompt"] = PromptTemplate(
+                input_variables=["context", "question"],
+                template=config["MAP_PROMPT_TEMPLATE"],
+            )
+        return pipeline
+
+    def get_pipeline(self, mode="qa"):
+        """Return the cached pipeline for a mode, building it on first use"""
+        pipeline = self._pipelines.get(mode)
+        if pipeline is None:
+            with self._lock:
+                pipeline = self._pipelines.get(mode)
+                if pipeline is None:
+                    pipeline = self._build_pipeline(mode)
+                    self._pipelines[mode] = pipeline
+        return pipeline
+
+    def resolve_filters(self, filters):
+        """
+        Chroma `where` clause for metadata filter expressions such as
+        "file_type=pdf" or "source~=/projects/pouches/" (see metadata_filter.py)
+        Returns: the clause, or None without filters
+        """
+        if not filters:
+            return None
+        if isinstance(filters, str):
+            filters = [filters]
+        indexed_files = load_manifest(self.index_dir)["files"] if needs_manifest(filters) else ()
+        return build_where(filters, indexed_files)
+
+    def retrieve(self, question, mode="qa", where=None):
+        """Return the chunks used as context for a question (`where`: a Chroma metadata filter)"""
+        return self.retrieve_with_vectors(question, mode, where=where)[0]
+
+    def retrieve_with_vectors(self, question, mode="qa", query_vector=None, where=None):
+        """
+        Return the chunks for a question with their stored vectors (None when
+        the retriever doesn't provide them). `query_vector` is the question's
+        embedding, if already computed (e.g. in a batch); `where` is a Chroma
+        metadata filter (see resolve_filters).
+        """
+        retriever = self.get_pipeline(mode)["retriever"]
+        if hasattr(retriever, "invoke_with_vectors"):
+            return retriever.invoke_with_vectors(question, query_vector=query_vector, where=where)
+        search_kwargs = dict(retriever.search_kwargs)
+        if where is not None:
+            search_kwargs["filter"] = where
+        with trace("query.vector_search"):
+            if query_vector is not None and retriever.search_type == "similarity":
+                return self.vectorstore.similarity_search_by_vector(query_vector, **search_kwargs), None
+            return retriever.invoke(question, **search_kwargs), None
+
+    def get_chunk_embeddings(self, docs):
+        """Stored vectors of retrieved chunks; chunks without an id are re-embedded (usually an embedding-cache hit)"""
+        ids = [getattr(doc, "id", None) for doc in docs]
+        stored = {}
+        if any(ids):
+            found = self.vectorstore._collection.get(ids=[i for i in ids if i], include=["embeddings"])
+            stored = dict(zip(found["ids"], found["embeddings"]))
+        vectors = [stored.get(chunk_id) for chunk_id in ids]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            recomputed = self.embeddings.embed_documents([docs[i].page_content for i in missing])
+            for i, vector in zip(missing, recomputed):
+                vectors[i] = vector
+        return vectors
+
+    def score_documents(self, question, docs, vectors=None, query_vector=None):
+        """Cosine similarity of each chunk to the question"""
+        if not docs:
+            return []
+        if vectors is None:
+            vectors = self.get_chunk_embeddings(docs)
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(question)
+        return cosine_similarities(query_vector, vectors).tolist()
+
+    def prepare_context(self, question, mode="qa", query_vector=None, where=None):
+        """
+        Retrieve chunks (matching the `where` metadata filter, if any),
+        optionally rerank them, and pack the ones worth sending into the mode's
+        context budget
+        Returns: (passages, report of dropped chunks/tokens, {"retrieval", "rerank"} seconds)
+        """
+        pipeline = self.get_pipeline(mode)
+        config = pipeline["config"]
+        start = time.time()
+        docs, vectors = self.retrieve_with_vectors(question, mode, query_vector, where)
+        with trace("query.scoring"):
+            scores = self.score_documents(question, docs, vectors, query_vector)
+        retrieved = time.time()
+
+        priorities = None
+        if pipeline["reranker"] is not None and docs:
+            with trace("query.rerank"):
+                order, priorities = pipeline["reranker"].rerank(question, docs, config["RERANK_TOP_N"])
+            docs = [docs[i] for i in order]
+            scores = [scores[i] for i in order]
+        timings = {"retrieval": retrieved - start, "rerank": time.time() - retrieved}
+
+        max_tokens = config.get("MAX_CONTEXT_TOKENS") or MAX_CONTEXT_LENGTH // CHARS_PER_TOKEN
+        # The similarity cutoff filters dense results; the reranker has already chosen its chunks
+        min_score = SIMILARITY_SCORE_THRESHOLD if priorities is None else None
+        with trace("query.context_packing"):
+            docs, report = pack_context(docs, scores, max_tokens, min_score, priorities=priorities)
+        if report["threshold_fallback"]:
+            print(f"Warning: no retrieved chunk reached SIMILARITY_SCORE_THRESHOLD ({min_score}); "
+                  "using the best ones anyway, the answer may be unreliable.")
+        return docs, report, timings
+
+    def summarize_groups(self, question, docs, mode):
+        """
+        Map step of the "map_reduce" strategy: split the passages into groups of
+        MAP_GROUP_TOKENS and summarise the groups concurrently.
+        Returns: list of group summaries, or None when everything fits in one group
+        """
+        pipeline = self.get_pipeline(mode)
+        config = pipeline["config"]
+        groups = pack_windows([doc.page_content for doc in docs], config["MAP_GROUP_TOKENS"], separator="\n\n")
+        if len(groups) <= 1:
+            return None
+        prompts = [pipeline["map_prompt"].format(context=group, question=question) for group in groups]
+        with trace("query.map_summaries"):
+            return pipeline["llm"].batch(prompts, config={"max_concurrency": config["MAP_CONCURRENCY"]})
+
+    def build_prompt(self, question, docs, mode="qa"):
+        """
+        Build the final prompt for a question.
+
+        "stuff" puts every passage in the prompt; "map_reduce" first summarises
+        groups of passages (see summarize_groups) and combines the summaries.
+        Returns: (prompt, number of group summaries, 0 for a single prompt)
+        """
+        pipeline = self.get_pipeline(mode)
+        summaries = None
+        if pipeline["config"].get("GENERATION_STRATEGY") == "map_reduce":
+            summaries = self.summarize_groups(question, docs, mode)
+        if summaries:
+            context = "\n\n".join(
+                f"Summary of excerpt group {i} of {len(summaries)}:\n{summary}"
+                for i, summary in enumerate(summaries, 1)
+            )
+        else:
+            context = "\n\n".join(doc.page_content for doc in docs)
+        with trace("query.prompt_build"):
+            prompt = pipeline["prompt"].format(context=context, question=question)
+        return prompt, len(summaries or ())
+
+    def _generate_tokens(self, prompt, mode):
+        """Stream the LLM's answer, recording time to first token, generation time and tokens"""
+        start = time.perf_counter()
+        tokens = 0
+        try:
+            for text in self.get_pipeline(mode)["llm"].stream(prompt):
+                if tokens == 0:
+                    record("query.time_to_first_token", time.perf_counter() - start)
+                tokens += 1
+                yield text
+        finally:
+            record("query.generation", time.perf_counter() - start)
+            increment("tokens_generated", tokens)
+
+    def generate(self, question, docs, mode="qa"):
+        """Answer a question from already prepared context passages"""
+        prompt, _ = self.build_prompt(question, docs, mode)
+        return "".join(self._generate_tokens(prompt, mode))
+
+    @staticmethod
+    def _cache_key(mode, where):
+        # Answers to filtered questions are only reused under the same filter
+        return mode if where is None else f"{mode} {json.dumps(where, sort_keys=True)}"
+
+    def _cached(self, question, mode, where=None):
+        """Return (cached result or None, question vector for storing a new answer)"""
+        increment("queries")
+        if self.answer_cache is None:
+            return None, None
+        with trace("query.answer_cache"):
+            cached, kind, vector = self.answer_cache.get(
+                question, self._cache_key(mode, where), embed=self.embeddings.embed_query
+            )
+        if cached is not None:
+            increment("answer_cache_hits")
+            cached = dict(cached, query=question, cached=kind)
+        return cached, vector
+
+    def _store(self, question, mode, where, answer, docs, vector):
+        if self.answer_cache is not None:
+            self.answer_cache.put(
+                question, self._cache_key(mode, where), {"result": answer, "source_documents": docs},
+                vector=vector, embed=self.embeddings.embed_query
+            )
+
+    def query(self, question, return_sources=True, mode="qa", filters=None):
+        """
+        Answer a question in the given mode ("qa" or "summary"), searching only
+        chunks that match the metadata `filters` (see resolve_filters), if given
+        Returns: dict {"query", "result", "source_documents", "context_report", "timings"}, or
+        {"query", "result", "source_documents", "cached"} ("exact" or "semantic")
+        when the answer came from the answer cache
+        """
+        where = self.resolve_filters(filters)
+        result, vector = self._cached(question, mode, where)
+        if result is None:
+            docs, report, timings = self.prepare_context(question, mode, where=where)
+            generation_start = time.time()
+            answer = self.generate(question, docs, mode)
+            timings["generation"] = time.time() - generation_start
+            self._store(question, mode, where, answer, docs, vector)
+            result = {
+                "query": question, "result": answer, "source_documents": docs,
+                "context_report": report, "timings": {stage: round(t, 3) for stage, t in timings.items()},
+            }
+
+        if not return_sources:
+            result.pop("source_documents", None)
+        return result
+
+    def stream(self, question, mode="qa", filters=None):
+        """
+        Answer a question (optionally within metadata `filters`), yielding
+        events as they become available:
+          {"type": "sources", "sources": [...], "context_report": {...}}
+                                                 context passages, before generation starts
+          {"type": "token", "text": ...}         generated text, as the LLM produces it
+          {"type": "done", ...}                  timings: retrieval, rerank, time to first token, tokens/sec
+        A cached answer is sent as a single token, with "cached" set in the done event.
+        """
+        start = time.time()
+        where = self.resolve_filters(filters)
+        cached, vector = self._cached(question, mode, where)
+        if cached is not None:
+            yield {"type": "sources", "sources": describe_sources(cached["source_documents"])}
+            yield {"type": "token", "text": cached["result"]}
+            elapsed = round(time.time() - start, 3)
+            yield {
+                "type": "done",
+                "time_to_first_token": elapsed,
+                "retrieval_time": 0.0,
+                "rerank_time": 0.0,
+                "map_time": 0.0,
+                "map_groups": 0,
+                "total_time": elapsed,
+                "tokens": 0,
+                "tokens_per_second": None,
+                "cached": cached["cached"],
+            }
+            return
+
+        docs, report, timings = self.prepare_context(question, mode, where=where)
+        yield {"type": "sources", "sources": describe_sources(docs), "context_report": report}
+
+        map_start = time.time()
+        prompt, groups = self.build_prompt(question, docs, mode)
+        generation_start = time.time()
+        first_token_time = None
+        tokens = 0
+        parts = []
+        for text in self._generate_tokens(prompt, mode):
+            if first_token_time is None:
+                first_token_time = time.time()
+            tokens += 1
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        # Only complete answers are cached (a disconnected client stops the generator above)
+        self._store(question, mode, where, "".join(parts), docs, vector)
+
+        end = time.time()
+        generation_time = end - (first_token_time or end)
+        yield {
+            "type": "done",
+            "time_to_first_token": round((first_token_time or end) - start, 3),
+            "retrieval_time": round(timings["retrieval"], 3),
+            "rerank_time": round(timings["rerank"], 3),
+            "map_time": round(generation_start - map_start, 3),
+            "map_groups": groups,
+            "total_time": round(end - start, 3),
+            "tokens": tokens,
+            "tokens_per_second": round(tokens / generation_time, 1) if generation_time > 0 else None,
+        }
+
+def format_timings(timings):
+    """One-line summary of per-stage timings"""
+    return "Timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+
+def describe_sources(docs, preview_chars=150):
+    """JSON-friendly summary of source chunks"""
+    return [
+        {
+            "source": doc.metadata.get("source", "Unknown"),
+            "content": doc.page_content[:preview_chars],
+        }
+        for doc in docs
+    ]
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(collection=None):
+    """Return the process-wide engine of a collection (default: COLLECTION_NAME), creating it on first use"""
+    collection = collection or COLLECTION_NAME
+    engine = _engines.get(collection)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(collection)
+            if engine is None:
+                if collection != COLLECTION_NAME and collection not in list_collections(VECTOR_DB_PATH):
+                    indexed = ", ".join(list_collections(VECTOR_DB_PATH)) or "none"
+                    raise ValueError(f"Unknown collection {collection!r} (indexed collections: {indexed})")
+                with trace("query.engine_init"):
+                    engine = RagEngine(collection=collection)
+                _engines[collection] = engine
+    return engine
+
+def get_default_engine():
+    """Return the process-wide engine of the default collection"""
+    return get_engine()
+
+def query_rag(question, return_sources=True, mode="qa", collection=None, filters=None):
     """
     Query the RAG system with specified mode
     
@@ -23,6 +443,8 @@ def query_rag(question, return_sources=True, mode="qa"):
         question: The question to ask
         return_sources: Whether to return source documents
         mode: "qa" for precise Q&A, "summary" for comprehensive analysis, or "extract" for systematic extraction
+        collection: Collection to search (default: COLLECTION_NAME)
+        filters: Metadata filter expressions, e.g. ["file_type=pdf", "source~=/projects/pouches/"]
     """
     # Extract mode uses a different script
     if mode == "extract":
@@ -30,57 +452,127 @@ def query_rag(question, return_sources=True, mode="qa"):
         print("  python extract_documents.py 'your extraction query'")
         return None
     
-    # Get mode-specific configuration
-    config = get_mode_config(mode)
-    
-    # Initialize embeddings
-    embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
-    
-    # Load the existing vector store
-    vectorstore = Chroma(
-        persist_directory=VECTOR_DB_PATH,
-        embedding_function=embeddings
-    )
-    
-    # Initialize the LLM with mode-specific temperature
-    llm = OllamaLLM(model=LLM_MODEL, temperature=config["TEMPERATURE"])
-    
-    # Create a retriever with mode-specific parameters
-    retriever_kwargs = {
-        "k": config["RETRIEVAL_K"],
-    }
-    
-    # Add MMR-specific parameters if using MMR search
-    if config["RETRIEVAL_SEARCH_TYPE"] == "mmr":
-        retriever_kwargs["fetch_k"] = config["RETRIEVAL_FETCH_K"]
-        retriever_kwargs["lambda_mult"] = config["RETRIEVAL_LAMBDA_MULT"]
-    
-    retriever = vectorstore.as_retriever(
-        search_type=config["RETRIEVAL_SEARCH_TYPE"],
-        search_kwargs=retriever_kwargs
-    )
-    
-    # Use mode-specific prompt template
-    QA_CHAIN_PROMPT = PromptTemplate(
-        input_variables=["context", "question"],
-        template=config["PROMPT_TEMPLATE"],
-    )
-    
-    # Create the QA chain
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=return_sources,
-        chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}
-    )
-    
-    # Get the answer
-    result = qa_chain.invoke({"query": question})
-    
-    return result
+    return get_engine(collection).query(question, return_sources=return_sources, mode=mode, filters=filters)
+
+def print_streamed_answer(question, show_sources=True, mode="qa", collection=None, filters=None):
+    """Print sources as soon as retrieval finishes, then the answer as it is generated"""
+    for event in get_engine(collection).stream(question, mode=mode, filters=filters):
+        if event["type"] == "sources":
+            if event.get("context_report"):
+                print(format_context_report(event["context_report"]))
+            if show_sources:
+                print(f"Source Documents ({len(event['sources'])}):")
+                for i, source in enumerate(event["sources"], 1):
+                    print(f"{i}. {source['source']}")
+                print()
+            print("Answer: ", end="", flush=True)
+        elif event["type"] == "token":
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "done" and event.get("cached"):
+            print(f"\n\n[answer cache hit ({event['cached']}), {event['total_time']:.2f}s]")
+        elif event["type"] == "done":
+            rate = event["tokens_per_second"]
+            groups = f"{event['map_groups']} group summaries in {event['map_time']:.2f}s, " if event["map_groups"] else ""
+            print(f"\n\n[retrieval {event['retrieval_time']:.2f}s, rerank {event['rerank_time']:.2f}s, "
+                  f"{groups}first token {event['time_to_first_token']:.2f}s, "
+                  f"{event['tokens']} tokens in {event['total_time']:.2f}s"
+                  f"{f', {rate} tokens/sec' if rate else ''}]")
+
+def read_questions(path, default_mode):
+    """
+    Read a questions file: one JSON object per line with "question" and
+    optionally "id", "mode" and "where" (filter expressions, added to --where);
+    a bare JSON string is also accepted
+    """
+    questions = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            if not item.get("question"):
+                raise ValueError(f"{path}:{line_number}: missing \"question\"")
+            item.setdefault("id", line_number)
+            item.setdefault("mode", default_mode)
+            if item["mode"] not in ("qa", "summary"):
+                raise ValueError(f"{path}:{line_number}: mode must be \"qa\" or \"summary\"")
+            if isinstance(item.get("where"), str):
+                item["where"] = [item["where"]]
+            questions.append(item)
+    return questions
+
+def answer_batch(input_path, output_path, mode=DEFAULT_MODE, concurrency=BATCH_QUERY_CONCURRENCY,
+                 collection=None, filters=None):
+    """
+    Answer every question in a JSONL file with one engine: questions are
+    embedded in batches, retrieval runs for each in turn, and generations run
+    `concurrency` at a time. Answers, sources and per-stage timings are written
+    to `output_path` as JSONL, in input order. The answer cache is bypassed so
+    every answer is freshly generated. `filters` apply to every question.
+    """
+    questions = read_questions(input_path, mode)
+    engine = get_engine(collection)
+    print(f"Answering {len(questions)} questions from {input_path} ({concurrency} generations at a time)")
+
+    # Batched embedding calls; each question is charged its share of its batch's time
+    start = time.time()
+    query_vectors = []
+    embed_times = []
+    for i in range(0, len(questions), EMBED_BATCH_SIZE):
+        batch = [item["question"] for item in questions[i:i + EMBED_BATCH_SIZE]]
+        batch_start = time.time()
+        query_vectors.extend(engine.embeddings.embed_documents(batch))
+        embed_times.extend([(time.time() - batch_start) / len(batch)] * len(batch))
+    print(f"  Embedded {len(questions)} questions in {time.time() - start:.1f}s")
+
+    def generate(item, docs, report, timings):
+        generation_start = time.time()
+        answer = engine.generate(item["question"], docs, item["mode"])
+        timings["generation"] = time.time() - generation_start
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "mode": item["mode"],
+            "answer": answer,
+            "sources": describe_sources(docs),
+            "context_report": report,
+            "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        }
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor, open(output_path, "w") as out:
+        futures = []
+        # Retrieval runs here while earlier questions are generating
+        for item, query_vector, embed_time in zip(questions, query_vectors, embed_times):
+            try:
+                where = engine.resolve_filters((filters or []) + item.get("where", []))
+                docs, report, timings = engine.prepare_context(item["question"], item["mode"], query_vector, where)
+            except Exception as e:
+                futures.append((item, e))
+                continue
+            timings = {"embedding": embed_time, **timings}
+            futures.append((item, executor.submit(generate, item, docs, report, timings)))
 
-def main(show_sources=None, mode=None):
+        for done, (item, future) in enumerate(futures, 1):
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                row = future.result()
+            except Exception as e:
+                failed += 1
+                row = {"id": item["id"], "question": item["question"], "mode": item["mode"],
+                       "error": f"{type(e).__name__}: {e}"}
+            out.write(json.dumps(row) + "\n")
+            out.flush()
+            print(f"\r  Answered {done}/{len(questions)}", end="", flush=True)
+
+    print(f"\nDone in {time.time() - start:.1f}s: {len(questions) - failed} answered, {failed} failed. "
+          f"Results written to {output_path}")
+
+def main(show_sources=None, mode=None, stream=False, profile=False, collection=None, filters=None):
     # Use the provided values, or fall back to config defaults
     if show_sources is None:
         show_sources = SHOW_SOURCES
@@ -96,6 +588,9 @@ def main(show_sources=None, mode=None):
         config = get_mode_config(mode)
         print(f"Retrieval: {config['RETRIEVAL_SEARCH_TYPE'].upper()} (k={config['RETRIEVAL_K']}, temp={config['TEMPERATURE']})")
     print(f"Source display: {'ON' if show_sources else 'OFF'}")
+    print(f"Collection: {collection or COLLECTION_NAME}")
+    if filters:
+        print(f"Filters: {', '.join(filters)}")
     print("\nCommands:")
     print("  - Type 'quit' or 'exit' to quit")
     print("  - Type 'mode qa', 'mode summary', or 'mode extract' to switch modes")
@@ -107,6 +602,8 @@ def main(show_sources=None, mode=None):
         question = input("Ask a question: ").strip()
         
         if question.lower() in ['quit', 'exit', 'q']:
+            if profile:
+                print(format_profile() + "\n")
             print("Goodbye!")
             break
         
@@ -147,11 +644,26 @@ def main(show_sources=None, mode=None):
         
         print(f"\n[{mode.upper()} mode] Searching for answer...\n")
         
+        if stream:
+            try:
+                print_streamed_answer(question, show_sources=show_sources, mode=mode,
+                                      collection=collection, filters=filters)
+                print("\n" + "="*80 + "\n")
+            except Exception as e:
+                print(f"\nError: {e}\n")
+            continue
+        
         try:
-            result = query_rag(question, return_sources=show_sources, mode=mode)
+            result = query_rag(question, return_sources=show_sources, mode=mode,
+                               collection=collection, filters=filters)
             
             if result:
                 print("Answer:", result['result'])
+                if result.get('cached'):
+                    print(f"(from answer cache, {result['cached']} match)")
+                elif result.get('context_report'):
+                    print(format_context_report(result['context_report']))
+                    print(format_timings(result['timings']))
                 
                 if show_sources and 'source_documents' in result:
                     print(f"\nSource Documents ({len(result.get('source_documents', []))}):")
@@ -183,6 +695,18 @@ Examples:
   # Single question in summary mode
   python rag_query.py --mode summary "Summarize all research on health effects"
   
+  # Print the answer as it is generated
+  python rag_query.py --stream "What are nicotine pouches?"
+  
+  # Show where the time goes
+  python rag_query.py --profile "What are nicotine pouches?"
+  
+  # Answer a file of questions (one JSON object per line: {"question": ..., "id": ..., "mode": ...})
+  python rag_query.py --batch questions.jsonl --output answers.jsonl
+  
+  # Search one collection, and only PDFs from one project folder
+  python rag_query.py --collection reports --where "source~=/projects/pouches/" --where file_type=pdf "What was measured?"
+  
   # Extract mode (uses separate script)
   python extract_documents.py "List all chemicals mentioned"
         """
@@ -192,9 +716,31 @@ Examples:
     parser.add_argument('--sources', action='store_true', help='Enable source document display (default)')
     parser.add_argument('--mode', choices=['qa', 'summary'], default=DEFAULT_MODE, 
                        help='Retrieval mode: "qa" for precise Q&A, "summary" for comprehensive analysis')
+    parser.add_argument('--stream', action='store_true',
+                       help='Print sources first, then the answer token by token, with timing')
+    parser.add_argument('--batch', metavar='QUESTIONS_JSONL',
+                       help='Answer every question in a JSONL file and write the results as JSONL')
+    parser.add_argument('--output', metavar='ANSWERS_JSONL',
+                       help='Output file for --batch (default: <questions file>.answers.jsonl)')
+    parser.add_argument('--concurrency', type=int, default=BATCH_QUERY_CONCURRENCY,
+                       help=f'Answers generated at once with --batch (default: {BATCH_QUERY_CONCURRENCY})')
+    parser.add_argument('--profile', action='store_true',
+                       help='Print time spent per stage (embedding, search, generation, ...) at the end')
+    parser.add_argument('--collection', help=f'Collection to search (default: {COLLECTION_NAME})')
+    parser.add_argument('--where', action='append', metavar='FILTER',
+                       help='Only search chunks matching a metadata filter, e.g. file_type=pdf, mtime>=2024-01-01, '
+                            'root=/data/docs/ or source~=/projects/pouches/ (substring or glob); repeat to combine')
     
     args = parser.parse_args()
     
+    if args.batch:
+        output = args.output or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+        answer_batch(args.batch, output, mode=args.mode, concurrency=args.concurrency,
+                     collection=args.collection, filters=args.where)
+        if args.profile:
+            print("\n" + format_profile())
+        sys.exit(0)
+    
     # Determine whether to show sources
     if args.no_sources:
         show_sources = False
@@ -206,11 +752,27 @@ Examples:
     if args.question:
         # If command line argument provided, use it as the question
         question = " ".join(args.question)
+        if args.stream:
+            try:
+                print(f"[{args.mode.upper()} mode]")
+                print_streamed_answer(question, show_sources=show_sources, mode=args.mode,
+                                      collection=args.collection, filters=args.where)
+            except Exception as e:
+                print(f"\nError: {e}")
+            if args.profile:
+                print("\n" + format_profile())
+            sys.exit(0)
         try:
-            result = query_rag(question, return_sources=show_sources, mode=args.mode)
+            result = query_rag(question, return_sources=show_sources, mode=args.mode,
+                               collection=args.collection, filters=args.where)
             if result:
                 print(f"[{args.mode.upper()} mode]")
                 print("Answer:", result['result'])
+                if result.get('cached'):
+                    print(f"(from answer cache, {result['cached']} match)")
+                elif result.get('context_report'):
+                    print(format_context_report(result['context_report']))
+                    print(format_timings(result['timings']))
                 
                 if show_sources and 'source_documents' in result:
                     print(f"\nSource Documents ({len(result.get('source_documents', []))}):")
@@ -219,6 +781,9 @@ Examples:
                         print(f"{i}. {source}")
         except Exception as e:
             print(f"Error: {e}")
+        if args.profile:
+            print("\n" + format_profile())
     else:
         # Interactive mode
-        main(show_sources=show_sources, mode=args.mode)
+        main(show_sources=show_sources, mode=args.mode, stream=args.stream, profile=args.profile,
+             collection=args.collection, filters=args.where)
@@ -0,0 +1,95 @@
+"""
+Optional cross-encoder reranking of retrieved chunks.
+
+A small cross-encoder (RERANKER_MODEL, run on the CPU) scores every
+(question, chunk) pair among the retrieved candidates so only the best few
+reach the LLM. Pairs are scored in batches of RERANK_BATCH_SIZE and scores
+are cached by question + chunk ID, so repeated questions skip the model.
+Requires sentence-transformers (`pip install sentence-transformers`); without
+it reranking is skipped with a warning.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from config import RERANKER_MODEL, RERANK_BATCH_SIZE, RERANK_CACHE_SIZE
+
+try:
+    from sentence_transformers import CrossEncoder
+    HAS_CROSS_ENCODER = True
+except ImportError:
+    HAS_CROSS_ENCODER = False
+
+def _chunk_key(doc):
+    chunk_id = getattr(doc, "id", None)
+    return chunk_id or hashlib.sha1(doc.page_content.encode()).hexdigest()
+
+class Reranker:
+    """Cross-encoder scorer with an LRU cache of (question, chunk) scores"""
+
+    def __init__(self, model_name=RERANKER_MODEL, batch_size=RERANK_BATCH_SIZE, cache_size=RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def score(self, question, docs):
+        """Relevance score of each chunk to the question (higher is better)"""
+        question_key = " ".join(question.lower().split())
+        keys = [(question_key, _chunk_key(doc)) for doc in docs]
+        with self._lock:
+            scores = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in scores:
+                self._cache.move_to_end(key)
+            missing = [(key, doc) for key, doc in zip(keys, docs) if key not in scores]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                # One model call, batched; the lock keeps concurrent requests from oversubscribing the CPU
+                pairs = [(question, doc.page_content) for _, doc in missing]
+                predicted = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+                for (key, _), value in zip(missing, predicted):
+                    scores[key] = float(value)
+                    self._cache[key] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [scores[key] for key in keys]
+
+    def rerank(self, question, docs, top_n):
+        """
+        Keep the `top_n` best chunks
+        Returns: (indices into docs, best first; their scores)
+        """
+        scores = self.score(question, docs)
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return order, [scores[i] for i in order]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._cache),
+            }
+
+def get_reranker():
+    """A Reranker, or None (with a warning) when sentence-transformers isn't installed"""
+    if not HAS_CROSS_ENCODER:
+        print("Warning: sentence-transformers is not installed, reranking is disabled. "
+              "Install it with: pip install sentence-transformers")
+        return None
+    return Reranker()
@@ -0,0 +1,35 @@
+"""Tests for answer_cache.py"""
+
+from answer_cache import AnswerCache
+
+VECTORS = {
+    "what is nicotine?": [1.0, 0.0, 0.0],
+    "what's nicotine?": [0.99, 0.05, 0.0],
+    "list flavourings": [0.0, 1.0, 0.0],
+}
+
+def embed(question):
+    return VECTORS[question.lower()]
+
+def test_exact_matches_only_by_default(tmp_path):
+    cache = AnswerCache(str(tmp_path), similarity_threshold=None)
+    cache.put("What is nicotine?", "qa", "answer")
+    assert cache.get("  what IS nicotine? ", "qa", embed)[:2] == ("answer", "exact")
+    assert cache.get("What's nicotine?", "qa", embed)[:2] == (None, None)
+    assert cache.get("What is nicotine?", "summary", embed)[:2] == (None, None)
+
+def test_semantic_tier(tmp_path):
+    cache = AnswerCache(str(tmp_path), similarity_threshold=0.95)
+    cache.put("What is nicotine?", "qa", "nicotine answer", embed=embed)
+    cache.put("List flavourings", "qa", "flavour answer", embed=embed)
+    assert cache.get("What's nicotine?", "qa", embed)[:2] == ("nicotine answer", "semantic")
+    # Other modes never share answers
+    assert cache.get("What's nicotine?", "summary", embed)[:2] == (None, None)
+
+def test_evicted_questions_leave_the_semantic_tier(tmp_path):
+    cache = AnswerCache(str(tmp_path), max_entries=1, similarity_threshold=0.95)
+    cache.put("What is nicotine?", "qa", "nicotine answer", embed=embed)
+    cache.put("List flavourings", "qa", "flavour answer", embed=embed)
+    assert cache.get("What's nicotine?", "qa", embed)[:2] == (None, None)
+    assert cache.get("List flavourings", "qa", embed)[:2] == ("flavour answer", "exact")
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,51 @@
+"""Tests for file_discovery.py"""
+
+import os
+from file_discovery import discover_files, glob_to_regex, new_discovery_stats
+
+def make_tree(root, paths):
+    for path in paths:
+        full = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w") as f:
+            f.write("content")
+
+def discovered(root, **kwargs):
+    return sorted(os.path.relpath(path, root) for path, _ in discover_files(str(root), **kwargs))
+
+def test_hidden_files_and_folders_are_skipped(tmp_path):
+    make_tree(tmp_path, [
+        "condathis.md", "._condathis.md", "._ALA-Nicotine-Pouches.pdf", ".DS_Store",
+        ".hidden/notes.md", "sub/paper.pdf", "sub/._paper.pdf",
+    ])
+    stats = new_discovery_stats()
+    found = discovered(tmp_path, include=["**/*.md", "**/*.pdf"], exclude=[], stats=stats)
+    assert found == ["condathis.md", os.path.join("sub", "paper.pdf")]
+    assert stats["pruned_dirs"] == 1
+
+def test_include_and_exclude_patterns(tmp_path):
+    make_tree(tmp_path, [
+        "a.md", "b.txt", "image.png", "node_modules/pkg/readme.md", "deep/er/c.MD", "deep/skip.log",
+    ])
+    found = discovered(tmp_path, include=["**/*.md", "**/*.txt", "**/*.log"],
+                       exclude=["**/node_modules/**", "**/*.log"])
+    assert found == ["a.md", "b.txt", os.path.join("deep", "er", "c.MD")]
+
+def test_glob_to_regex():
+    assert glob_to_regex("**/*.pdf").match("report.pdf")
+    assert glob_to_regex("**/*.pdf").match("a/b/report.PDF")
+    assert not glob_to_regex("*.pdf").match("a/report.pdf")
+    assert glob_to_regex("**/.git/**").match("repo/.git/")
+    assert glob_to_regex("doc?.txt").match("doc1.txt")
+    assert not glob_to_regex("doc?.txt").match("doc12.txt")
+
+def test_excluded_folders_are_pruned_and_old_files_skipped(tmp_path):
+    make_tree(tmp_path, ["keep.md", "old.md", "__pycache__/cached.md", "src/.git/config.md"])
+    old = os.path.join(tmp_path, "old.md")
+    os.utime(old, (0, 0))
+    stats = new_discovery_stats()
+    found = discovered(tmp_path, include=["**/*.md"], exclude=["**/__pycache__/**"], max_age_days=30, stats=stats)
+    assert found == ["keep.md"]
+    assert stats["too_old"] == 1
+    # __pycache__ by pattern, .git as a hidden folder
+    assert stats["pruned_dirs"] == 2
@@ -0,0 +1,57 @@
+"""A keyword-only hit must survive the similarity cutoff in pack_context"""
+
+from langchain_core.documents import Document
+from lexical_index import HybridRetriever, LexicalIndex
+from text_packing import pack_context
+from vector_ops import cosine_similarities
+
+CHUNKS = {
+    "a": ("Nicotine pouches are placed between the lip and gum.", [1.0, 0.0]),
+    "b": ("Pouch users report fewer throat irritation symptoms.", [0.9, 0.1]),
+    "cas": ("Substance register entry 54-11-5, purity 99.5%.", [0.0, 1.0]),
+}
+
+class FakeCollection:
+    """The two Chroma calls HybridRetriever makes, over a fixed vector ranking"""
+
+    def query(self, query_embeddings, n_results, where=None, include=()):
+        ids = ["a", "b"][:n_results]
+        return {
+            "ids": [ids],
+            "documents": [[CHUNKS[i][0] for i in ids]],
+            "metadatas": [[{"source": f"{i}.md"} for i in ids]],
+            "embeddings": [[CHUNKS[i][1] for i in ids]],
+        }
+
+    def get(self, ids, where=None, include=()):
+        return {
+            "ids": ids,
+            "documents": [CHUNKS[i][0] for i in ids],
+            "metadatas": [{"source": f"{i}.md"} for i in ids],
+            "embeddings": [CHUNKS[i][1] for i in ids],
+        }
+
+class FakeVectorStore:
+    _collection = FakeCollection()
+
+def test_bm25_only_hit_survives_similarity_threshold(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(list(CHUNKS), [text for text, _ in CHUNKS.values()], [f"{i}.md" for i in CHUNKS])
+    retriever = HybridRetriever(FakeVectorStore(), embeddings=None, lexical_index=index, k=3, fetch_k=2)
+
+    query_vector = [1.0, 0.0]
+    docs, vectors = retriever.invoke_with_vectors("Which products contain 54-11-5?", query_vector=query_vector)
+    assert {doc.id for doc in docs} == {"a", "b", "cas"}
+    assert next(doc for doc in docs if doc.id == "cas").metadata["lexical_rank"] == 1
+
+    scores = cosine_similarities(query_vector, vectors).tolist()
+    packed, report = pack_context(docs, scores, max_tokens=1000, min_score=0.5)
+    assert any("54-11-5" in doc.page_content for doc in packed)
+    assert report["below_threshold"] == 0
+
+def test_dense_hits_below_threshold_are_dropped():
+    docs = [Document(page_content="relevant", metadata={"source": "a"}),
+            Document(page_content="off topic", metadata={"source": "b"})]
+    packed, report = pack_context(docs, [0.8, 0.2], max_tokens=1000, min_score=0.5)
+    assert [doc.page_content for doc in packed] == ["relevant"]
+    assert report["below_threshold"] == 1
@@ -0,0 +1,71 @@
+"""Tests for lexical_index.py"""
+
+import lexical_index
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+def test_tokenize_keeps_cas_numbers_and_compound_names():
+    terms = tokenize("Nicotine (CAS 54-11-5) and 2,4-Dinitrotoluene in the pouch")
+    assert "54-11-5" in terms
+    assert "2,4-dinitrotoluene" in terms
+    # Parts of compound tokens are indexed too, stop words are not
+    assert {"54", "11", "5", "dinitrotoluene"} <= set(terms)
+    assert "the" not in terms and "and" not in terms
+
+def test_tokenize_drops_trailing_punctuation():
+    assert tokenize("Found nicotine.") == ["found", "nicotine"]
+
+def test_bm25_ranks_exact_identifier_first(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(
+        ["a", "b", "c"],
+        [
+            "Nicotine pouches contain nicotine salts and flavourings.",
+            "The register lists nicotine under CAS 54-11-5.",
+            "Flavourings such as menthol are common.",
+        ],
+        ["a.md", "b.md", "c.md"],
+    )
+    assert len(index) == 3
+    assert index.search("54-11-5", 3)[0][0] == "b"
+    assert [chunk_id for chunk_id, _ in index.search("flavourings", 3)] in (["a", "c"], ["c", "a"])
+    assert index.search("the and of", 3) == []
+
+def test_bm25_prefers_higher_term_frequency(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(["once", "twice"], ["menthol flavour pouch", "menthol menthol flavour pouch"], ["x", "y"])
+    assert [chunk_id for chunk_id, _ in index.search("menthol", 2)] == ["twice", "once"]
+
+def test_delete_source_updates_index(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(["a", "b"], ["nicotine", "nicotine menthol"], ["one.md", "two.md"])
+    index.delete_source("one.md")
+    assert len(index) == 1
+    assert [chunk_id for chunk_id, _ in index.search("nicotine", 5)] == ["b"]
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a", "d"]], k=60)
+    # Ranked high by both beats first in one but last in the other; one ranking alone comes last
+    assert [item for item, _ in fused] == ["b", "a", "c", "d"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+def test_very_common_terms_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "MIN_SKIPPED_DF", 0)
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(
+        ["a", "b", "c", "d"],
+        ["pouch nicotine", "pouch menthol", "pouch nicotine menthol menthol", "pouch"],
+        ["w", "x", "y", "z"],
+    )
+    # "pouch" is in every chunk: only "nicotine" decides the ranking
+    assert [chunk_id for chunk_id, _ in index.search("pouch nicotine", 3)] == ["a", "c"]
+    # With nothing rarer left, the rarest term is still used
+    assert len(index.search("pouch", 5)) == 4
+
+def test_term_frequencies_rebuilt_for_older_index(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.add_chunks(["a", "b"], ["nicotine menthol", "nicotine"], ["x", "y"])
+    with index._conn:
+        index._conn.execute("DROP TABLE terms")
+    reopened = LexicalIndex(str(tmp_path))
+    assert dict(reopened._conn.execute("SELECT term, df FROM terms")) == {"nicotine": 2, "menthol": 1}
+    assert reopened.search("menthol", 2)[0][0] == "a"
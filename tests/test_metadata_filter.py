@@ -0,0 +1,48 @@
+"""Tests for metadata_filter.py (--where expressions)"""
+
+from datetime import datetime
+import pytest
+from metadata_filter import build_where, match_sources, needs_manifest, parse_filter
+
+FILES = ["/data/pouches/study.pdf", "/data/pouches/notes.md", "/data/other/report.pdf"]
+
+def test_parse_filter_operators_and_values():
+    assert parse_filter("file_type=.PDF") == ("file_type", "$eq", "pdf")
+    assert parse_filter("page_number >= 3") == ("page_number", "$gte", 3)
+    assert parse_filter("root=/data/pouches") == ("root", "$eq", "/data/pouches/")
+    assert parse_filter("source~=pouches") == ("source", "~=", "pouches")
+    assert parse_filter("mtime<1700000000") == ("mtime", "$lt", 1700000000.0)
+    assert parse_filter("mtime>=2024-01-31") == ("mtime", "$gte", datetime(2024, 1, 31).timestamp())
+
+@pytest.mark.parametrize("expression", [
+    "file_type",             # no operator
+    "author=someone",        # unknown field
+    "file_type~=pdf",        # ~= only for source
+    "file_type>pdf",         # comparison on a text field
+    "page_number=three",     # not a number
+    "mtime>=last tuesday",   # not a date
+])
+def test_parse_filter_rejects_invalid(expression):
+    with pytest.raises(ValueError):
+        parse_filter(expression)
+
+def test_match_sources_substring_and_glob():
+    assert match_sources("pouches", FILES) == FILES[:2]
+    assert match_sources("*.pdf", FILES) == [FILES[0], FILES[2]]
+    assert match_sources("/data/*/notes.md", FILES) == [FILES[1]]
+
+def test_build_where():
+    assert build_where([]) is None
+    assert build_where(["file_type=pdf"]) == {"file_type": {"$eq": "pdf"}}
+    assert build_where(["file_type=pdf", "source~=pouches"], FILES) == {"$and": [
+        {"file_type": {"$eq": "pdf"}},
+        {"source": {"$in": sorted(FILES[:2])}},
+    ]}
+
+def test_build_where_source_pattern_without_match():
+    with pytest.raises(ValueError):
+        build_where(["source~=missing"], FILES)
+
+def test_needs_manifest():
+    assert needs_manifest(["file_type=pdf", "source~=*.pdf"])
+    assert not needs_manifest(["file_type=pdf"])
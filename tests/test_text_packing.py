@@ -0,0 +1,76 @@
+"""Tests for text_packing.py"""
+
+from langchain_core.documents import Document
+from text_packing import (
+    document_order_key, estimate_tokens, format_context_report, merge_overlapping_chunks, pack_context,
+    pack_windows,
+)
+
+TEXT = "Nicotine pouches are smokeless products. They contain nicotine salts, fillers and flavourings."
+
+def chunk(start, end, **metadata):
+    return Document(page_content=TEXT[start:end], metadata={"source": "a.md", **metadata})
+
+def test_merge_overlapping_chunks_with_start_index():
+    chunks = [chunk(0, 50, start_index=0), chunk(40, 95, start_index=40)]
+    assert "".join(merge_overlapping_chunks(chunks)) == TEXT[:95]
+
+def test_merge_overlapping_chunks_detects_overlap_without_start_index():
+    chunks = [chunk(0, 50), chunk(40, 95)]
+    assert "".join(merge_overlapping_chunks(chunks, max_overlap=20)) == TEXT[:95]
+
+def test_merge_keeps_pages_separate():
+    chunks = [chunk(0, 50, page_number=1), chunk(40, 95, page_number=2)]
+    assert merge_overlapping_chunks(chunks) == [TEXT[0:50], TEXT[40:95]]
+
+def test_document_order_key():
+    metadatas = [{"page_number": 2, "start_index": 0}, {"page_number": 1, "start_index": 300}, {"page_number": 1}]
+    order = sorted(range(3), key=lambda i: document_order_key(i, metadatas[i]))
+    assert order == [2, 1, 0]
+
+def test_pack_windows_respects_budget_and_order():
+    segments = ["a" * 30, "b" * 30, "c" * 50]
+    windows = pack_windows(segments, max_tokens=16)  # 64 characters
+    assert windows == ["a" * 30 + "\n" + "b" * 30, "c" * 50]
+    assert all(len(window) <= 64 for window in windows)
+
+def test_pack_windows_splits_oversized_segment():
+    assert pack_windows(["x" * 150], max_tokens=16) == ["x" * 64, "x" * 64, "x" * 22]
+    assert pack_windows([], max_tokens=16) == []
+
+def test_pack_context_merges_neighbours_and_drops_duplicates():
+    docs = [
+        chunk(0, 50, start_index=0),
+        chunk(40, 95, start_index=40),
+        Document(page_content="Unrelated duplicate.", metadata={"source": "b.md"}),
+        Document(page_content="Unrelated duplicate.", metadata={"source": "c.md"}),
+    ]
+    packed, report = pack_context(docs, [0.9, 0.8, 0.7, 0.6], max_tokens=1000)
+    assert packed[0].page_content == TEXT[:95]
+    assert report["merged"] == 1
+    assert report["duplicates"] == 1
+    assert report["kept"] == 2
+
+def test_pack_context_keeps_best_within_budget():
+    docs = [Document(page_content=text, metadata={"source": source})
+            for text, source in (("low " * 10, "a"), ("high " * 10, "b"))]
+    budget = estimate_tokens(docs[1].page_content)
+    packed, report = pack_context(docs, [0.6, 0.9], max_tokens=budget)
+    assert [doc.metadata["source"] for doc in packed] == ["b"]
+    assert report["over_budget"] == 1
+    # Priorities (e.g. reranker scores) override similarity
+    packed, _ = pack_context(docs, [0.6, 0.9], max_tokens=budget, priorities=[2.0, 1.0])
+    assert [doc.metadata["source"] for doc in packed] == ["a"]
+
+def test_pack_context_falls_back_when_every_chunk_is_below_threshold():
+    docs = [Document(page_content=text, metadata={"source": source})
+            for text, source in (("weak match", "a"), ("weaker match", "b"))]
+    packed, report = pack_context(docs, [0.3, 0.2], max_tokens=1000, min_score=0.5)
+    assert [doc.metadata["source"] for doc in packed] == ["a", "b"]
+    assert report["threshold_fallback"]
+    assert report["below_threshold"] == 0
+    assert "kept the best anyway" in format_context_report(report)
+
+def test_pack_context_without_chunks():
+    packed, report = pack_context([], [], max_tokens=1000, min_score=0.5)
+    assert packed == [] and not report["threshold_fallback"]
@@ -0,0 +1,26 @@
+"""Tests for vector_ops.py"""
+
+import numpy as np
+from vector_ops import cosine_similarities, maximal_marginal_relevance, normalize_rows
+
+def test_normalize_rows_keeps_zero_rows():
+    rows = normalize_rows([[3.0, 4.0], [0.0, 0.0]])
+    assert np.allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
+
+def test_cosine_similarities():
+    scores = cosine_similarities([1.0, 0.0], [[2.0, 0.0], [0.0, 5.0], [1.0, 1.0]])
+    assert np.allclose(scores, [1.0, 0.0, np.sqrt(0.5)])
+    assert len(cosine_similarities([1.0, 0.0], [])) == 0
+
+def test_mmr_pure_relevance_is_similarity_order():
+    candidates = [[0.0, 1.0], [1.0, 0.1], [1.0, 0.0], [1.0, 0.5]]
+    assert maximal_marginal_relevance([1.0, 0.0], candidates, k=3, lambda_mult=1.0) == [2, 1, 3]
+
+def test_mmr_skips_near_duplicates():
+    # Two copies of the best match and one less relevant but different chunk
+    candidates = [[1.0, 0.0], [1.0, 0.001], [0.6, 0.8]]
+    assert maximal_marginal_relevance([1.0, 0.1], candidates, k=2, lambda_mult=0.5) == [1, 2]
+
+def test_mmr_k_larger_than_candidates():
+    assert sorted(maximal_marginal_relevance([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], k=5)) == [0, 1]
+    assert maximal_marginal_relevance([1.0, 0.0], np.zeros((0, 2)), k=3) == []
@@ -0,0 +1,206 @@
+"""
+Helpers for fitting document text into LLM context budgets.
+
+Token counts are estimated from character length (CHARS_PER_TOKEN in
+config.py), which is close enough for llama-style tokenizers on English text
+and needs no tokenizer download.
+"""
+
+import math
+from config import CHARS_PER_TOKEN, CHUNK_OVERLAP
+
+def estimate_tokens(text):
+    """Rough token count for a piece of text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def tokens_to_chars(tokens):
+    """Character budget corresponding to a token budget"""
+    return int(tokens * CHARS_PER_TOKEN)
+
+def document_order_key(position, metadata):
+    """
+    Sort key restoring a chunk's position in its source document:
+    page first (if known), then character offset, then storage order
+    """
+    metadata = metadata or {}
+    start_index = metadata.get("start_index")
+    return (
+        metadata.get("page_number", 0),
+        start_index if start_index is not None else -1,
+        position,
+    )
+
+def _suffix_prefix_overlap(previous, current, max_overlap):
+    """Length of the longest suffix of `previous` that is a prefix of `current`"""
+    for size in range(min(max_overlap, len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:size]):
+            return size
+    return 0
+
+def merge_overlapping_chunks(documents, max_overlap=CHUNK_OVERLAP):
+    """
+    Turn chunks (in document order) back into non-overlapping text segments.
+
+    The splitter repeats up to CHUNK_OVERLAP characters between neighbouring
+    chunks. When chunks carry a start_index the overlap is trimmed exactly,
+    otherwise it is detected by matching the previous chunk's tail.
+    """
+    segments = []
+    previous = None
+    previous_end = None
+    previous_page = None
+
+    for doc in documents:
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        page = doc.metadata.get("page_number")
+
+        overlap = 0
+        if previous is not None and page == previous_page:
+            if start is not None and previous_end is not None:
+                overlap = max(0, min(previous_end - start, len(text)))
+            else:
+                overlap = _suffix_prefix_overlap(previous, text, max_overlap)
+
+        trimmed = text[overlap:]
+        if trimmed.strip():
+            segments.append(trimmed)
+
+        previous = text
+        previous_end = start + len(text) if start is not None else None
+        previous_page = page
+
+    return segments
+
+def pack_windows(segments, max_tokens, separator="\n"):
+    """
+    Greedily pack text segments, in order, into windows of at most `max_tokens`.
+    A segment larger than a whole window is split across windows.
+    """
+    max_chars = tokens_to_chars(max_tokens)
+    windows = []
+    current = ""
+
+    for segment in segments:
+        candidate = current + separator + segment if current else segment
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+
+        if current:
+            windows.append(current)
+            current = ""
+        while len(segment) > max_chars:
+            windows.append(segment[:max_chars])
+            segment = segment[max_chars:]
+        current = segment
+
+    if current:
+        windows.append(current)
+    return windows
+
+def new_context_report(retrieved=0):
+    return {
+        "retrieved": retrieved, "below_threshold": 0, "duplicates": 0, "merged": 0,
+        "over_budget": 0, "kept": 0, "tokens_kept": 0, "tokens_dropped": 0, "threshold_fallback": False,
+    }
+
+def pack_context(documents, scores, max_tokens, min_score=None, max_overlap=CHUNK_OVERLAP, priorities=None):
+    """
+    Choose the retrieved chunks that go into a prompt.
+
+    Chunks scoring below `min_score` are dropped, except keyword matches (a
+    "lexical_rank" in their metadata, see HybridRetriever): an exact name or
+    CAS number can be only weakly similar to the question as a whole. If
+    every chunk is below `min_score`, the threshold is ignored rather than
+    leaving the prompt without context (report["threshold_fallback"]).
+    Overlapping neighbours from
+    the same source are merged into one passage (so shared text is only sent
+    once), exact duplicates are dropped, and the best passages are packed into
+    `max_tokens`. "Best" follows `priorities` (e.g. reranker scores) when
+    given, otherwise `scores`.
+    Returns: (passages as Documents, best first; report dict of what was dropped)
+    """
+    report = new_context_report(len(documents))
+    if priorities is None:
+        priorities = scores
+
+    candidates = []
+    for position, (doc, score, priority) in enumerate(zip(documents, scores, priorities)):
+        if min_score is not None and score < min_score and "lexical_rank" not in doc.metadata:
+            report["below_threshold"] += 1
+            report["tokens_dropped"] += estimate_tokens(doc.page_content)
+            continue
+        candidates.append((position, doc, priority))
+    if documents and not candidates:
+        report["below_threshold"] = report["tokens_dropped"] = 0
+        report["threshold_fallback"] = True
+        candidates = [(position, doc, priority)
+                      for position, (doc, priority) in enumerate(zip(documents, priorities))]
+
+    # Runs of overlapping chunks from one source become a single passage
+    candidates.sort(key=lambda c: (c[1].metadata.get("source", ""), document_order_key(c[0], c[1].metadata)))
+    passages = []
+    run = []
+
+    def close_run():
+        if not run:
+            return
+        first = run[0][1]
+        if len(run) == 1:
+            passage = first
+        else:
+            segments = merge_overlapping_chunks([doc for _, doc, _ in run], max_overlap)
+            passage = type(first)(page_content="".join(segments), metadata=dict(first.metadata))
+        passages.append((passage, max(priority for _, _, priority in run)))
+        report["merged"] += len(run) - 1
+        run.clear()
+
+    for position, doc, priority in candidates:
+        if run:
+            previous = run[-1][1]
+            previous_start = previous.metadata.get("start_index")
+            start = doc.metadata.get("start_index")
+            contiguous = (
+                previous.metadata.get("source") == doc.metadata.get("source")
+                and previous.metadata.get("page_number") == doc.metadata.get("page_number")
+                and previous_start is not None and start is not None
+                and start <= previous_start + len(previous.page_content)
+            )
+            if not contiguous:
+                close_run()
+        run.append((position, doc, priority))
+    close_run()
+
+    passages.sort(key=lambda p: p[1], reverse=True)
+    packed = []
+    seen = set()
+    for passage, _ in passages:
+        text = passage.page_content
+        tokens = estimate_tokens(text)
+        if text in seen:
+            report["duplicates"] += 1
+            report["tokens_dropped"] += tokens
+            continue
+        if report["tokens_kept"] + tokens > max_tokens:
+            report["over_budget"] += 1
+            report["tokens_dropped"] += tokens
+            continue
+        seen.add(text)
+        packed.append(passage)
+        report["tokens_kept"] += tokens
+
+    report["kept"] = len(packed)
+    return packed, report
+
+def format_context_report(report):
+    """One-line summary of pack_context's report"""
+    line = (
+        f"Context: {report['kept']} passages from {report['retrieved']} chunks, "
+        f"~{report['tokens_kept']} tokens kept, ~{report['tokens_dropped']} dropped "
+        f"({report['below_threshold']} below score threshold, {report['merged']} merged with a neighbour, "
+        f"{report['duplicates']} duplicates, {report['over_budget']} over budget)"
+    )
+    if report.get("threshold_fallback"):
+        line += " - every chunk was below the score threshold, kept the best anyway"
+    return line
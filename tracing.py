@@ -0,0 +1,127 @@
+"""
+Lightweight per-stage latency tracing.
+
+Stages (query embedding, vector search, generation, MAP calls, ...) record
+their durations into process-wide histograms, and events (tokens generated,
+chunks embedded, ...) into counters. The web servers expose both in
+Prometheus text format on /metrics; the CLIs print a summary table with
+--profile.
+
+    with trace("query.vector_search"):
+        ...
+    record("query.time_to_first_token", seconds)
+    increment("tokens_generated", count)
+"""
+
+import contextlib
+import threading
+import time
+
+# Upper bounds (seconds) of the histogram buckets: from fast lookups to long generations
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+def record(stage, seconds):
+    """Record one duration for a stage"""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = _Histogram()
+        histogram.observe(seconds)
+
+def increment(counter, value=1):
+    """Add to an event counter"""
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+
+@contextlib.contextmanager
+def trace(stage):
+    """Time the enclosed block as one occurrence of `stage` (also when it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def snapshot():
+    """Current stages and counters as plain dicts (for benchmark reports)"""
+    with _lock:
+        return {
+            "stages": {
+                stage: {
+                    "count": histogram.count,
+                    "total_seconds": histogram.total,
+                    "mean_ms": histogram.total / histogram.count * 1000,
+                    "max_ms": histogram.max * 1000,
+                }
+                for stage, histogram in sorted(_histograms.items())
+            },
+            "counters": dict(sorted(_counters.items())),
+        }
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def render_prometheus(prefix="rag"):
+    """All stages and counters in Prometheus text exposition format"""
+    with _lock:
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Time spent per pipeline stage",
+            f"# TYPE {prefix}_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(_histograms.items()):
+            label = f'stage="{_escape(stage)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{prefix}_stage_duration_seconds_sum{{{label}}} {histogram.total}")
+            lines.append(f"{prefix}_stage_duration_seconds_count{{{label}}} {histogram.count}")
+        for counter, value in sorted(_counters.items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+    return "\n".join(lines) + "\n"
+
+def format_profile():
+    """Per-stage summary table (for --profile)"""
+    with _lock:
+        if not _histograms and not _counters:
+            return "No stages recorded."
+        width = max([len("Stage")] + [len(stage) for stage in _histograms])
+        lines = [f"{'Stage':<{width}}  {'Calls':>7}  {'Total s':>9}  {'Mean ms':>9}  {'Max ms':>9}"]
+        lines.append("-" * len(lines[0]))
+        for stage, histogram in sorted(_histograms.items()):
+            mean = histogram.total / histogram.count * 1000
+            lines.append(
+                f"{stage:<{width}}  {histogram.count:>7}  {histogram.total:>9.2f}  {mean:>9.1f}  {histogram.max * 1000:>9.1f}"
+            )
+        for counter, value in sorted(_counters.items()):
+            lines.append(f"{counter}: {value}")
+    return "\n".join(lines)
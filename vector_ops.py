@@ -0,0 +1,141 @@
+"""
+Vector math over stored chunk embeddings (NumPy).
+
+Candidate vectors come straight from Chroma (`include=["embeddings"]`), so
+ranking, MMR and relevance scoring never send a chunk back to the embedding
+model. Everything is vectorised across candidates.
+"""
+
+import numpy as np
+from langchain_core.documents import Document
+from tracing import trace
+
+def normalize_rows(matrix):
+    """Scale each row to unit length (zero rows stay zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def cosine_similarities(query, matrix):
+    """Cosine similarity of one vector to every row of a matrix"""
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return normalize_rows(matrix) @ normalize_rows(query)[0]
+
+def maximal_marginal_relevance(query, candidates, k, lambda_mult=0.5):
+    """
+    Pick `k` candidates balancing relevance to the query against similarity to
+    already-picked ones. Each step costs one matrix-vector product: the
+    highest similarity of every candidate to the picked set is kept up to date
+    instead of being recomputed against all picked vectors.
+    Returns: list of candidate indices, in pick order
+    """
+    candidates = normalize_rows(candidates)
+    count = len(candidates)
+    k = min(k, count)
+    if k <= 0:
+        return []
+
+    relevance = candidates @ normalize_rows(query)[0]
+    selected = [int(np.argmax(relevance))]
+    redundancy = candidates @ candidates[selected[0]]
+    available = np.ones(count, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
+
+def score_sources(collection, query, best_chunks=3, where=None, page_size=5000):
+    """
+    Relevance of every source in a collection to a query vector: the mean
+    cosine similarity of its `best_chunks` best-matching chunks. One pass over
+    the stored embeddings, a page at a time; nothing is re-embedded.
+    Returns: dict {source: score}
+    """
+    query = normalize_rows(query)[0]
+    source_index = {}
+    chunk_sources = []
+    chunk_scores = []
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=["metadatas", "embeddings"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        offset += len(page["ids"])
+        chunk_scores.append(normalize_rows(page["embeddings"]) @ query)
+        chunk_sources.append(np.fromiter(
+            (source_index.setdefault((metadata or {}).get("source", ""), len(source_index))
+             for metadata in page["metadatas"]),
+            dtype=np.int64, count=len(page["ids"])
+        ))
+    if not chunk_scores:
+        return {}
+
+    sources = np.concatenate(chunk_sources)
+    scores = np.concatenate(chunk_scores)
+    # Group chunks by source, best first, and keep each source's top `best_chunks`
+    order = np.lexsort((-scores, sources))
+    sources, scores = sources[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]])
+    rank = np.arange(len(sources)) - np.repeat(starts, np.diff(np.r_[starts, len(sources)]))
+    keep = rank < best_chunks
+    totals = np.bincount(sources[keep], weights=scores[keep], minlength=len(source_index))
+    counts = np.bincount(sources[keep], minlength=len(source_index))
+    means = totals / np.maximum(counts, 1)
+    return {source: float(means[i]) for source, i in source_index.items()}
+
+class MMRRetriever:
+    """
+    Retriever for the "mmr" search type: one Chroma query returns the
+    `fetch_k` nearest chunks with their stored vectors, and MMR runs over
+    those vectors in NumPy.
+    """
+
+    def __init__(self, vectorstore, embeddings, k, fetch_k, lambda_mult):
+        self.collection = vectorstore._collection
+        self.embeddings = embeddings
+        self.k = k
+        self.fetch_k = max(k, fetch_k)
+        self.lambda_mult = lambda_mult
+
+    def invoke_with_vectors(self, question, query_vector=None, where=None):
+        """
+        `query_vector` is the question's embedding, if already computed;
+        `where` is a Chroma metadata filter
+        Returns: (documents, their stored vectors as a matrix)
+        """
+        query = query_vector
+        if query is None:
+            with trace("query.embedding"):
+                query = self.embeddings.embed_query(question)
+        with trace("query.vector_search"):
+            result = self.collection.query(
+                query_embeddings=[query],
+                n_results=self.fetch_k,
+                where=where,
+                include=["documents", "metadatas", "embeddings"],
+            )
+        ids = result["ids"][0]
+        if not ids:
+            return [], np.zeros((0, len(query)), dtype=np.float32)
+
+        vectors = np.asarray(result["embeddings"][0], dtype=np.float32)
+        with trace("query.mmr"):
+            picked = maximal_marginal_relevance(query, vectors, self.k, self.lambda_mult)
+        documents = [
+            Document(page_content=result["documents"][0][i], metadata=result["metadatas"][0][i] or {}, id=ids[i])
+            for i in picked
+        ]
+        return documents, vectors[picked]
+
+    def invoke(self, question, where=None):
+        return self.invoke_with_vectors(question, where=where)[0]